@@ -1,8 +1,11 @@
-from pydantic import BaseModel, EmailStr
-from typing import Optional, Dict, List
+from pydantic import BaseModel, EmailStr, Field, PlainSerializer, field_validator, model_validator
+from typing import Optional, Dict, List, Union, Annotated
 from datetime import date, datetime
 from decimal import Decimal
 
+# Money stays exact in Python but goes over the wire as a JSON number
+Money = Annotated[Decimal, PlainSerializer(float, return_type=float, when_used="json")]
+
 # User Models
 class UserBase(BaseModel):
     email: EmailStr
@@ -71,10 +74,34 @@ class BookSearch(BaseModel):
     author: Optional[str] = None
     availability_only: bool = False
 
+class SearchBook(BaseModel):
+    id: str
+    title: str
+    author: str
+    image_url: str = ""
+    price: str = "₹299"
+    source: str = "API"
+    year: str = "Unknown"
+    isbn: str = ""
+    available_copies: int = 1
+    total_copies: int = 1
+    can_issue: bool = True
+    genre: str = "General"
+
+class Suggestion(BaseModel):
+    text: str
+    kind: str  # title, author or query
+    book_id: Optional[str] = None
+
+class SuggestResponse(BaseModel):
+    suggestions: List[Suggestion]
+    took_ms: float = 0
+
 class SearchResult(BaseModel):
-    books: List[Book]
+    books: List[SearchBook]
     total_count: int
-    search_time_ms: float
+    search_time_ms: float = 0
+    error: Optional[str] = None
 
 # Borrowing Models
 class BorrowRequest(BaseModel):
@@ -86,28 +113,42 @@ class RenewalRequest(BaseModel):
 class BorrowedBook(BaseModel):
     id: int
     user_id: int
-    book_id: int
+    book_id: str
     book_title: str
     book_author: str
-    borrowed_date: date
+    book_image_url: Optional[str] = None
+    book_price: Optional[str] = None
+    issue_date: date
     due_date: date
-    returned_date: Optional[date] = None
-    renewal_count: int
-    fine_amount: Decimal
+    return_date: Optional[date] = None
+    renewal_count: int = 0
+    fine_amount: Money = Decimal("0.00")
     status: str
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+    current_fine: Money = Decimal("0.00")
     urgency: Optional[str] = None
+    urgency_text: Optional[str] = None
+    can_renew: bool = False
 
     class Config:
         from_attributes = True
 
+class IssuedBooksResponse(BaseModel):
+    success: bool
+    issued_books: List[BorrowedBook]
+    total_count: int
+    total_fine: Money
+
 # Reservation Models
 class ReservationRequest(BaseModel):
-    book_id: int
+    book_id: str
+    book_title: str = ""
 
 class Reservation(BaseModel):
     id: int
     user_id: int
-    book_id: int
+    book_id: str
     book_title: str
     reservation_date: date
     expiry_date: Optional[date] = None
@@ -125,7 +166,7 @@ class ChatMessage(BaseModel):
 class ChatResponse(BaseModel):
     type: str
     message: str
-    data: Optional[List[Dict]] = None
+    data: Optional[Union[List[BorrowedBook], List[SearchBook], Dict]] = None
     suggestions: Optional[List[str]] = None
 
 # AI Models
@@ -135,8 +176,47 @@ class AIAnalysis(BaseModel):
     extracted_info: Dict = {}
     response_suggestion: str
 
+CHAT_INTENTS = ("book_search", "issued_books", "renewals", "fines", "library_info", "help")
+
+class ChatIntent(BaseModel):
+    """Structured reply the chat model is asked for; unknown intents degrade to help"""
+    intent: str = Field("help", json_schema_extra={"enum": list(CHAT_INTENTS)})
+    type: str = Field("help", json_schema_extra={"enum": list(CHAT_INTENTS)})
+    message: str
+    suggestions: List[str] = []
+    search_query: str = ""
+    show_issued: bool = False
+    show_renewals: bool = False
+    show_fines: bool = False
+
+    @field_validator("intent", "type", mode="before")
+    @classmethod
+    def known_intent(cls, value):
+        return value if value in CHAT_INTENTS else "help"
+
+    @field_validator("search_query", mode="before")
+    @classmethod
+    def empty_search_query(cls, value):
+        return value or ""
+
+    @field_validator("suggestions", mode="before")
+    @classmethod
+    def empty_suggestions(cls, value):
+        return [] if value is None else value
+
+    @field_validator("show_issued", "show_renewals", "show_fines", mode="before")
+    @classmethod
+    def null_flag(cls, value):
+        return False if value is None else value
+
+    @model_validator(mode="after")
+    def type_follows_intent(self):
+        if "type" not in self.model_fields_set:
+            self.type = self.intent
+        return self
+
 class BookRecommendation(BaseModel):
-    book: Book
+    book: SearchBook
     reason: str
     confidence: float
 
@@ -154,6 +234,19 @@ class ReminderCreate(BaseModel):
     scheduled_date: date
     channel: str = "email"
 
+class Notification(BaseModel):
+    id: int
+    user_id: int
+    title: str
+    message: str
+    notification_type: str = "info"
+    is_read: bool = False
+    created_at: datetime
+
+class NotificationsResponse(BaseModel):
+    notifications: List[Notification]
+    unread_count: int = 0
+
 # Response Models
 class APIResponse(BaseModel):
     success: bool
@@ -0,0 +1 @@
+"""Services package for LibriPal backend"""
\ No newline at end of file
@@ -0,0 +1,126 @@
+import os
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+
+import asyncpg
+
+ANALYTICS_REFRESH_MINUTES = int(os.getenv("ANALYTICS_REFRESH_MINUTES", "15"))
+PERIODS = ("day", "week", "month")
+
+# Each view needs a unique index so it can be refreshed CONCURRENTLY without blocking readers
+MATERIALIZED_VIEWS = {
+    "mv_book_borrow_counts": ("""
+        SELECT book_id,
+               MAX(book_title) AS book_title,
+               MAX(book_author) AS book_author,
+               COUNT(*) AS borrow_count,
+               COUNT(DISTINCT user_id) AS unique_borrowers,
+               MAX(issue_date) AS last_borrowed
+        FROM loan_history
+        GROUP BY book_id
+    """, "book_id"),
+    "mv_loan_stats_monthly": ("""
+        SELECT date_trunc('month', issue_date::timestamp)::date AS month,
+               COUNT(*) AS loans,
+               COUNT(*) FILTER (
+                   WHERE return_date > due_date
+                      OR (status = 'issued' AND due_date < CURRENT_DATE)
+               ) AS overdue_loans
+        FROM loan_history
+        GROUP BY 1
+    """, "month"),
+    "mv_fine_revenue_daily": ("""
+        SELECT return_date AS day,
+               SUM(fine_amount) AS fine_total,
+               COUNT(*) AS fined_returns
+        FROM loan_history
+        WHERE status = 'returned' AND fine_amount > 0
+        GROUP BY return_date
+    """, "day"),
+    # Distinct users can't be summed across days, so each granularity is rolled up separately
+    "mv_active_users": ("""
+        WITH activity AS (
+            SELECT user_id, issue_date AS day FROM loan_history
+            UNION
+            SELECT user_id, return_date FROM loan_history WHERE return_date IS NOT NULL
+        )
+        SELECT 'day' AS period, day AS period_start, COUNT(DISTINCT user_id) AS active_users
+        FROM activity GROUP BY day
+        UNION ALL
+        SELECT 'week', date_trunc('week', day::timestamp)::date, COUNT(DISTINCT user_id)
+        FROM activity GROUP BY 2
+        UNION ALL
+        SELECT 'month', date_trunc('month', day::timestamp)::date, COUNT(DISTINCT user_id)
+        FROM activity GROUP BY 2
+    """, "period, period_start"),
+}
+
+
+class AnalyticsService:
+    """Library-wide reports served from materialized views over loan_history"""
+
+    async def init_views(self, db: asyncpg.Connection):
+        for name, (query, unique_columns) in MATERIALIZED_VIEWS.items():
+            # Views created before archived loans moved out of issued_books are rebuilt over loan_history
+            if await db.fetchval(
+                "SELECT definition NOT LIKE '%loan_history%' FROM pg_matviews WHERE matviewname = $1", name
+            ):
+                await db.execute(f"DROP MATERIALIZED VIEW {name}")
+            await db.execute(f"CREATE MATERIALIZED VIEW IF NOT EXISTS {name} AS {query}")
+            await db.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {name}_key ON {name} ({unique_columns})")
+        await db.execute("""
+            CREATE INDEX IF NOT EXISTS mv_book_borrow_counts_rank
+            ON mv_book_borrow_counts (borrow_count DESC)
+        """)
+
+    async def refresh(self, db: asyncpg.Connection):
+        for name in MATERIALIZED_VIEWS:
+            await db.execute(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {name}")
+        print("✅ Analytics views refreshed")
+
+    async def most_borrowed(self, db: asyncpg.Connection, limit: int = 10) -> List[Dict]:
+        rows = await db.fetch("""
+            SELECT book_id, book_title, book_author, borrow_count, unique_borrowers, last_borrowed
+            FROM mv_book_borrow_counts
+            ORDER BY borrow_count DESC, book_id
+            LIMIT $1
+        """, limit)
+        return [dict(row) for row in rows]
+
+    async def overdue_rates(self, db: asyncpg.Connection, months: int = 12) -> List[Dict]:
+        rows = await db.fetch("""
+            SELECT month, loans, overdue_loans,
+                   ROUND(overdue_loans::numeric / NULLIF(loans, 0), 4) AS overdue_rate
+            FROM mv_loan_stats_monthly
+            ORDER BY month DESC
+            LIMIT $1
+        """, months)
+        return [dict(row) for row in rows]
+
+    async def fine_revenue(self, db: asyncpg.Connection, period: str = "month",
+                           start: Optional[date] = None, end: Optional[date] = None) -> List[Dict]:
+        end = end or date.today()
+        start = start or end - timedelta(days=365)
+        rows = await db.fetch("""
+            SELECT date_trunc($1::text, day::timestamp)::date AS period_start,
+                   SUM(fine_total) AS fine_total,
+                   SUM(fined_returns) AS fined_returns
+            FROM mv_fine_revenue_daily
+            WHERE day BETWEEN $2 AND $3
+            GROUP BY 1
+            ORDER BY 1 DESC
+        """, period, start, end)
+        return [dict(row) for row in rows]
+
+    async def active_users(self, db: asyncpg.Connection, period: str = "month", limit: int = 12) -> List[Dict]:
+        rows = await db.fetch("""
+            SELECT period_start, active_users
+            FROM mv_active_users
+            WHERE period = $1
+            ORDER BY period_start DESC
+            LIMIT $2
+        """, period, limit)
+        return [dict(row) for row in rows]
+
+
+analytics_service = AnalyticsService()
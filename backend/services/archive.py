@@ -0,0 +1,204 @@
+import os
+import re
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+
+import asyncpg
+
+from services.user_versions import user_version_service
+
+# Returned loans and old notifications move out of the hot tables after this many days
+LOAN_ARCHIVE_AFTER_DAYS = int(os.getenv("LOAN_ARCHIVE_AFTER_DAYS", "90"))
+NOTIFICATION_ARCHIVE_AFTER_DAYS = int(os.getenv("NOTIFICATION_ARCHIVE_AFTER_DAYS", "60"))
+# Archive partitions older than this are detached; 0 keeps them forever.
+# Detached loan partitions are left as standalone tables for a cold dump, notification ones are dropped.
+LOAN_ARCHIVE_RETENTION_MONTHS = int(os.getenv("LOAN_ARCHIVE_RETENTION_MONTHS", "0"))
+NOTIFICATION_RETENTION_MONTHS = int(os.getenv("NOTIFICATION_RETENTION_MONTHS", "12"))
+# Rows moved per transaction, so the hot tables are never locked for long
+ARCHIVE_BATCH_SIZE = 5000
+
+LOAN_COLUMNS = (
+    "id, user_id, book_id, book_title, book_author, book_image_url, book_price, issue_date, due_date, "
+    "return_date, renewal_count, fine_amount, status, created_at, updated_at, copy_id"
+)
+NOTIFICATION_COLUMNS = "id, user_id, title, message, notification_type, is_read, created_at"
+
+# archive table -> (hot table, partition key, columns, retention months, drop detached partitions)
+ARCHIVES = {
+    "issued_books_archive": ("issued_books", "return_date", LOAN_COLUMNS, LOAN_ARCHIVE_RETENTION_MONTHS, False),
+    "notifications_archive": ("notifications", "created_at", NOTIFICATION_COLUMNS, NOTIFICATION_RETENTION_MONTHS, True),
+}
+PARTITION_NAME = re.compile(r"_p(\d{4})(\d{2})$")
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def add_months(day: date, months: int) -> date:
+    month = day.month - 1 + months
+    return date(day.year + month // 12, month % 12 + 1, 1)
+
+
+class ArchiveService:
+    """Hot/archive split for loan history and notifications.
+
+    issued_books and notifications keep only active loans and recent rows, so the
+    queries members hit every request scan small heaps. Older rows move to
+    archive tables range-partitioned by month; loan_history is the union of hot
+    and archived loans for reports and recommendations that need every loan.
+    """
+
+    def __init__(self, loan_after_days: int = LOAN_ARCHIVE_AFTER_DAYS,
+                 notification_after_days: int = NOTIFICATION_ARCHIVE_AFTER_DAYS):
+        self.loan_after_days = loan_after_days
+        self.notification_after_days = notification_after_days
+
+    async def init_tables(self, db: asyncpg.Connection):
+        """Needs issued_books.copy_id, so runs after the inventory tables"""
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS issued_books_archive (
+                id INTEGER NOT NULL,
+                user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+                book_id VARCHAR(255) NOT NULL,
+                book_title VARCHAR(500) NOT NULL,
+                book_author VARCHAR(500) NOT NULL,
+                book_image_url VARCHAR(500),
+                book_price VARCHAR(100),
+                issue_date DATE NOT NULL,
+                due_date DATE NOT NULL,
+                return_date DATE,
+                renewal_count INTEGER,
+                fine_amount DECIMAL(10, 2),
+                status VARCHAR(50),
+                created_at TIMESTAMP,
+                updated_at TIMESTAMP,
+                copy_id INTEGER,
+                PRIMARY KEY (id, return_date)
+            ) PARTITION BY RANGE (return_date)
+        """)
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS notifications_archive (
+                id INTEGER NOT NULL,
+                user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+                title VARCHAR(200) NOT NULL,
+                message TEXT NOT NULL,
+                notification_type VARCHAR(50),
+                is_read BOOLEAN,
+                created_at TIMESTAMP NOT NULL,
+                PRIMARY KEY (id, created_at)
+            ) PARTITION BY RANGE (created_at)
+        """)
+        for archive in ARCHIVES:
+            # Only catches rows outside every monthly partition; archive() creates partitions before moving rows
+            await db.execute(f"CREATE TABLE IF NOT EXISTS {archive}_default PARTITION OF {archive} DEFAULT")
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_issued_books_archive_user ON issued_books_archive (user_id)")
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_issued_books_archive_book ON issued_books_archive (book_id)")
+        await db.execute("CREATE INDEX IF NOT EXISTS idx_notifications_archive_user ON notifications_archive (user_id)")
+        await db.execute("""
+            CREATE INDEX IF NOT EXISTS idx_notifications_user_created
+            ON notifications (user_id, created_at DESC)
+        """)
+        await db.execute(f"""
+            CREATE OR REPLACE VIEW loan_history AS
+            SELECT {LOAN_COLUMNS} FROM issued_books
+            UNION ALL
+            SELECT {LOAN_COLUMNS} FROM issued_books_archive
+        """)
+        await self.ensure_partitions(db, [month_start(date.today()), add_months(date.today(), 1)])
+
+    async def partitions(self, db: asyncpg.Connection, archive: str) -> Dict[date, str]:
+        """Monthly partitions currently attached to an archive table, by month"""
+        rows = await db.fetch("""
+            SELECT c.relname FROM pg_inherits i
+            JOIN pg_class c ON c.oid = i.inhrelid
+            JOIN pg_class p ON p.oid = i.inhparent
+            WHERE p.relname = $1
+        """, archive)
+        months = {}
+        for row in rows:
+            match = PARTITION_NAME.search(row['relname'])
+            if match:
+                months[date(int(match.group(1)), int(match.group(2)), 1)] = row['relname']
+        return months
+
+    async def ensure_partitions(self, db: asyncpg.Connection, months: List[date], archives=ARCHIVES):
+        for archive in archives:
+            existing = await self.partitions(db, archive)
+            for month in sorted(set(months) - set(existing)):
+                name = f"{archive}_p{month:%Y%m}"
+                await db.execute(f"""
+                    CREATE TABLE IF NOT EXISTS {name} PARTITION OF {archive}
+                    FOR VALUES FROM ('{month.isoformat()}') TO ('{add_months(month, 1).isoformat()}')
+                """)
+                print(f"🗄️ Created partition {name}")
+
+    async def _move(self, db: asyncpg.Connection, archive: str, condition: str, cutoff: date,
+                    counter: Optional[str] = None) -> int:
+        """Move old rows in batches, bumping counter for their members so cached views revalidate"""
+        hot_table, key, columns, _, _ = ARCHIVES[archive]
+        months = [row['month'] for row in await db.fetch(f"""
+            SELECT DISTINCT date_trunc('month', {key})::date AS month FROM {hot_table}
+            WHERE {condition} AND {key} < $1
+        """, cutoff)]
+        await self.ensure_partitions(db, months, [archive])
+
+        moved = 0
+        while True:
+            async with db.transaction():
+                batch, user_ids = await db.fetchrow(f"""
+                    WITH moved AS (
+                        DELETE FROM {hot_table}
+                        WHERE id IN (
+                            SELECT id FROM {hot_table}
+                            WHERE {condition} AND {key} < $1
+                            ORDER BY id
+                            LIMIT $2
+                            FOR UPDATE SKIP LOCKED
+                        )
+                        RETURNING {columns}
+                    ), archived AS (
+                        INSERT INTO {archive} ({columns}) SELECT {columns} FROM moved
+                        RETURNING user_id
+                    )
+                    SELECT COUNT(*), array_remove(array_agg(DISTINCT user_id), NULL) FROM archived
+                """, cutoff, ARCHIVE_BATCH_SIZE)
+                if counter and user_ids:
+                    await user_version_service.bump_many(db, user_ids, counter)
+            moved += batch
+            if batch < ARCHIVE_BATCH_SIZE:
+                return moved
+
+    async def detach_expired(self, db: asyncpg.Connection) -> List[str]:
+        detached = []
+        for archive, (_, _, _, retention_months, drop) in ARCHIVES.items():
+            if retention_months <= 0:
+                continue
+            oldest_kept = add_months(month_start(date.today()), -retention_months)
+            for month, name in sorted((await self.partitions(db, archive)).items()):
+                if month >= oldest_kept:
+                    break
+                await db.execute(f"ALTER TABLE {archive} DETACH PARTITION {name}")
+                if drop:
+                    await db.execute(f"DROP TABLE {name}")
+                print(f"🗄️ {'Dropped' if drop else 'Detached'} partition {name}")
+                detached.append(name)
+        return detached
+
+    async def archive(self, db: asyncpg.Connection) -> Dict:
+        """Move old rows out of the hot tables and detach expired archive partitions"""
+        today = date.today()
+        await self.ensure_partitions(db, [month_start(today), add_months(today, 1)])
+        loans = await self._move(
+            db, "issued_books_archive", "status = 'returned'", today - timedelta(days=self.loan_after_days)
+        )
+        notifications = await self._move(
+            db, "notifications_archive", "TRUE", today - timedelta(days=self.notification_after_days),
+            counter="notifications"
+        )
+        detached = await self.detach_expired(db)
+        print(f"✅ Archived {loans} loans and {notifications} notifications")
+        return {"loans": loans, "notifications": notifications, "detached": detached}
+
+
+archive_service = ArchiveService()
@@ -0,0 +1,127 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from jose import JWTError, jwk, jwt
+
+from services.lazy_import import lazy_module
+
+aiohttp = lazy_module("aiohttp")
+
+# e.g. https://<your-app>.clerk.accounts.dev/.well-known/jwks.json; unset disables auth for local development
+CLERK_JWKS_URL = os.getenv("CLERK_JWKS_URL", "")
+CLERK_ISSUER = os.getenv("CLERK_ISSUER", "")
+CLERK_AUDIENCE = os.getenv("CLERK_AUDIENCE", "")
+# Origins allowed in the azp claim Clerk puts in session tokens
+CLERK_AUTHORIZED_PARTIES = [p.strip() for p in os.getenv("CLERK_AUTHORIZED_PARTIES", "").split(",") if p.strip()]
+JWKS_REFRESH_MINUTES = int(os.getenv("JWKS_REFRESH_MINUTES", "60"))
+JWKS_MIN_REFETCH_SECONDS = 30
+TOKEN_CACHE_SIZE = 10000
+CLOCK_SKEW_SECONDS = 5
+ALLOWED_ALGORITHMS = ["RS256"]
+
+
+class AuthError(Exception):
+    """The bearer token is missing, malformed, expired or not signed by a known key"""
+
+
+@dataclass(frozen=True)
+class AuthenticatedUser:
+    id: int
+    clerk_id: str
+
+
+class JWKSCache:
+    """Signing keys by kid, parsed once and refreshed in the background.
+
+    An unknown kid triggers an immediate refetch (key rotation), at most once
+    every JWKS_MIN_REFETCH_SECONDS so bogus tokens can't hammer the JWKS endpoint.
+    """
+
+    def __init__(self, url: str):
+        self.url = url
+        self.keys: Dict[str, jwk.Key] = {}
+        self._fetched_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def refresh(self):
+        async with self._lock:
+            async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=10)) as session:
+                async with session.get(self.url) as response:
+                    response.raise_for_status()
+                    payload = await response.json(content_type=None)
+            keys = {}
+            for key in payload.get("keys", []):
+                if key.get("kid") and key.get("alg", "RS256") in ALLOWED_ALGORITHMS and key.get("use", "sig") == "sig":
+                    keys[key["kid"]] = jwk.construct(key, key.get("alg", "RS256"))
+            self.keys = keys
+            self._fetched_at = time.monotonic()
+            print(f"🔑 Loaded {len(keys)} signing keys from JWKS")
+
+    async def key_for(self, kid: str) -> Optional[jwk.Key]:
+        key = self.keys.get(kid)
+        if key is None and time.monotonic() - self._fetched_at > JWKS_MIN_REFETCH_SECONDS:
+            await self.refresh()
+            key = self.keys.get(kid)
+        return key
+
+
+class TokenVerifier:
+    """Verifies RS256 bearer tokens against the JWKS and memoizes claims until each token expires"""
+
+    def __init__(self, jwks: JWKSCache, issuer: str = CLERK_ISSUER, audience: str = CLERK_AUDIENCE,
+                 authorized_parties: List[str] = CLERK_AUTHORIZED_PARTIES):
+        self.jwks = jwks
+        self.issuer = issuer or None
+        self.audience = audience or None
+        self.authorized_parties = authorized_parties
+        self._claims: "OrderedDict[str, Dict]" = OrderedDict()
+
+    async def verify(self, token: str) -> Dict:
+        cached = self._claims.get(token)
+        if cached is not None:
+            if cached["exp"] > time.time():
+                return cached
+            del self._claims[token]
+
+        try:
+            header = jwt.get_unverified_header(token)
+        except JWTError as e:
+            raise AuthError(f"Malformed token: {e}")
+        if header.get("alg") not in ALLOWED_ALGORITHMS:
+            raise AuthError("Unsupported token algorithm")
+        key = await self.jwks.key_for(header.get("kid", ""))
+        if key is None:
+            raise AuthError("Token signed by an unknown key")
+
+        try:
+            claims = jwt.decode(
+                token, key, algorithms=ALLOWED_ALGORITHMS, issuer=self.issuer, audience=self.audience,
+                options={"verify_aud": self.audience is not None, "require_exp": True, "require_sub": True,
+                         "leeway": CLOCK_SKEW_SECONDS}
+            )
+        except JWTError as e:
+            raise AuthError(f"Invalid token: {e}")
+        if self.authorized_parties and claims.get("azp") not in self.authorized_parties:
+            raise AuthError("Token issued for another origin")
+
+        self._claims[token] = claims
+        if len(self._claims) > TOKEN_CACHE_SIZE:
+            self._claims.popitem(last=False)
+        return claims
+
+
+def bearer_token(authorization: Optional[str]) -> Optional[str]:
+    if not authorization:
+        return None
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token.strip():
+        return None
+    return token.strip()
+
+
+jwks_cache = JWKSCache(CLERK_JWKS_URL) if CLERK_JWKS_URL else None
+token_verifier = TokenVerifier(jwks_cache) if jwks_cache else None
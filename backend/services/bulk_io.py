@@ -0,0 +1,272 @@
+import asyncio
+import csv
+import io
+import os
+import tempfile
+from datetime import date, datetime, timedelta
+from decimal import Decimal, InvalidOperation
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+
+import asyncpg
+
+from services.inventory import InventoryService
+from services.lazy_import import lazy_module
+from services.user_versions import UserVersionService
+
+openpyxl = lazy_module("openpyxl")
+
+IMPORT_MAX_ERRORS = 100
+EXPORT_FETCH_SIZE = 2000
+# Rows per chunk written to the response; each chunk is one write on the socket
+EXPORT_CHUNK_ROWS = 500
+
+
+class ImportFormatError(Exception):
+    """The uploaded file can't be read as CSV or XLSX, or lacks required columns"""
+
+
+def _text(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+
+def _date(value: Any) -> Optional[date]:
+    if value is None or value == "":
+        return None
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return date.fromisoformat(str(value).strip()[:10])
+
+
+def _int(value: Any) -> Optional[int]:
+    if value is None or value == "":
+        return None
+    return int(float(value))
+
+
+def _money(value: Any) -> Optional[Decimal]:
+    if value is None or value == "":
+        return None
+    try:
+        return Decimal(str(value).replace("₹", "").strip()).quantize(Decimal("0.01"))
+    except InvalidOperation:
+        raise ValueError(f"not an amount: {value!r}")
+
+
+# column -> (parser, required); the record tuple follows this order
+USER_COLUMNS: Dict[str, Tuple[Callable, bool]] = {
+    "clerk_id": (_text, True),
+    "email": (_text, True),
+    "first_name": (_text, False),
+    "last_name": (_text, False),
+    "telegram_chat_id": (_text, False),
+}
+LOAN_COLUMNS: Dict[str, Tuple[Callable, bool]] = {
+    "user_email": (_text, True),
+    "book_id": (_text, True),
+    "book_title": (_text, True),
+    "book_author": (_text, True),
+    "issue_date": (_date, True),
+    "due_date": (_date, False),
+    "return_date": (_date, False),
+    "renewal_count": (_int, False),
+    "fine_amount": (_money, False),
+    "status": (_text, False),
+}
+
+EXPORTS: Dict[str, str] = {
+    "loans": """
+        SELECT b.id, u.email AS user_email, b.book_id, b.book_title, b.book_author,
+               b.issue_date, b.due_date, b.return_date, b.renewal_count, b.fine_amount, b.status
+        FROM loan_history b
+        JOIN users u ON u.id = b.user_id
+        ORDER BY b.id
+    """,
+    "users": """
+        SELECT id, clerk_id, email, first_name, last_name, telegram_chat_id, created_at
+        FROM users
+        ORDER BY id
+    """,
+}
+
+
+def read_rows(fileobj, filename: str) -> Iterator[Dict[str, Any]]:
+    """Rows of an uploaded CSV or XLSX file as dicts keyed by lower-cased header, one at a time"""
+    extension = os.path.splitext(filename or "")[1].lower()
+    if extension == ".csv":
+        reader = csv.reader(io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline=""))
+        rows = iter(reader)
+    elif extension == ".xlsx":
+        try:
+            workbook = openpyxl.load_workbook(fileobj, read_only=True, data_only=True)
+        except Exception as e:
+            raise ImportFormatError(f"Not a readable XLSX file: {e}")
+        rows = workbook.active.iter_rows(values_only=True)
+    else:
+        raise ImportFormatError("Upload a .csv or .xlsx file")
+
+    header = next(rows, None)
+    if not header:
+        return
+    columns = [str(name or "").strip().lower() for name in header]
+    for row in rows:
+        if row and any(cell not in (None, "") for cell in row):
+            yield dict(zip(columns, row))
+
+
+def validate_rows(rows: Iterator[Dict[str, Any]], columns: Dict[str, Tuple[Callable, bool]],
+                  max_borrow_days: int = 15) -> Tuple[List[tuple], List[str]]:
+    """Parse every row in one pass; returns (records, errors) and the caller loads nothing if errors"""
+    records, errors = [], []
+    checked_header = False
+    for line, row in enumerate(rows, start=2):
+        if not checked_header:
+            missing = [name for name, (_, required) in columns.items() if required and name not in row]
+            if missing:
+                raise ImportFormatError(f"Missing required columns: {', '.join(missing)}")
+            checked_header = True
+
+        values = []
+        try:
+            for name, (parse, required) in columns.items():
+                value = parse(row.get(name))
+                if value is None and required:
+                    raise ValueError(f"{name} is required")
+                values.append(value)
+        except (ValueError, TypeError) as e:
+            errors.append(f"Row {line}: {e}")
+            if len(errors) >= IMPORT_MAX_ERRORS:
+                errors.append("Too many errors, stopped checking")
+                break
+            continue
+
+        if columns is LOAN_COLUMNS:
+            loan = dict(zip(columns, values))
+            loan["due_date"] = loan["due_date"] or loan["issue_date"] + timedelta(days=max_borrow_days)
+            loan["renewal_count"] = loan["renewal_count"] or 0
+            loan["fine_amount"] = loan["fine_amount"] or Decimal("0.00")
+            loan["status"] = loan["status"] or ("returned" if loan["return_date"] else "issued")
+            if loan["status"] not in ("issued", "returned"):
+                errors.append(f"Row {line}: status must be issued or returned")
+                continue
+            values = [loan[name] for name in columns]
+        records.append(tuple(values))
+    return records, errors
+
+
+class BulkImporter:
+    """Loads validated records through a COPY into a temp table, then one set-based insert"""
+
+    def __init__(self, inventory: InventoryService, versions: UserVersionService):
+        self.inventory = inventory
+        self.versions = versions
+
+    async def import_users(self, db: asyncpg.Connection, records: List[tuple]) -> Dict[str, int]:
+        async with db.transaction():
+            await db.execute("""
+                CREATE TEMP TABLE user_import (
+                    clerk_id VARCHAR(255), email VARCHAR(255), first_name VARCHAR(100),
+                    last_name VARCHAR(100), telegram_chat_id VARCHAR(100)
+                ) ON COMMIT DROP
+            """)
+            await db.copy_records_to_table("user_import", records=records, columns=list(USER_COLUMNS))
+            inserted = await db.fetchval("""
+                WITH inserted AS (
+                    INSERT INTO users (clerk_id, email, first_name, last_name, telegram_chat_id)
+                    SELECT DISTINCT ON (clerk_id) clerk_id, email, first_name, last_name, telegram_chat_id
+                    FROM user_import
+                    ORDER BY clerk_id
+                    ON CONFLICT (clerk_id) DO NOTHING
+                    RETURNING 1
+                )
+                SELECT COUNT(*) FROM inserted
+            """)
+        return {"rows": len(records), "created": inserted, "skipped": len(records) - inserted}
+
+    async def import_loans(self, db: asyncpg.Connection, records: List[tuple]) -> Dict[str, Any]:
+        """All-or-nothing: fails without loading anything if any row names an unknown member"""
+        async with db.transaction():
+            await db.execute("""
+                CREATE TEMP TABLE loan_import (
+                    user_email VARCHAR(255), book_id VARCHAR(255), book_title VARCHAR(500),
+                    book_author VARCHAR(500), issue_date DATE, due_date DATE, return_date DATE,
+                    renewal_count INTEGER, fine_amount DECIMAL(10, 2), status VARCHAR(50)
+                ) ON COMMIT DROP
+            """)
+            await db.copy_records_to_table("loan_import", records=records, columns=list(LOAN_COLUMNS))
+
+            unknown = await db.fetch("""
+                SELECT DISTINCT l.user_email FROM loan_import l
+                WHERE NOT EXISTS (SELECT 1 FROM users u WHERE lower(u.email) = lower(l.user_email))
+                LIMIT 20
+            """)
+            if unknown:
+                return {"success": False, "unknown_members": [row['user_email'] for row in unknown]}
+
+            inserted = await db.fetchval("""
+                WITH inserted AS (
+                    INSERT INTO issued_books (user_id, book_id, book_title, book_author, issue_date, due_date,
+                                              return_date, renewal_count, fine_amount, status)
+                    SELECT u.id, l.book_id, l.book_title, l.book_author, l.issue_date, l.due_date,
+                           l.return_date, l.renewal_count, l.fine_amount, l.status
+                    FROM loan_import l
+                    JOIN LATERAL (
+                        SELECT id FROM users WHERE lower(email) = lower(l.user_email) ORDER BY id LIMIT 1
+                    ) u ON TRUE
+                    RETURNING 1
+                )
+                SELECT COUNT(*) FROM inserted
+            """)
+            open_loans = await db.fetch("""
+                SELECT book_id, MAX(book_title) AS title, MAX(book_author) AS author, COUNT(*) AS loans
+                FROM loan_import
+                WHERE status = 'issued'
+                GROUP BY book_id
+            """)
+            await self.inventory.absorb_open_loans(db, open_loans)
+            members = await db.fetch("""
+                SELECT DISTINCT u.id FROM loan_import l
+                JOIN users u ON lower(u.email) = lower(l.user_email)
+            """)
+            await self.versions.bump_many(db, [row['id'] for row in members], "loans")
+        return {"success": True, "rows": len(records), "created": inserted, "titles_on_loan": len(open_loans)}
+
+
+async def export_csv(db: asyncpg.Connection, kind: str) -> AsyncIterator[bytes]:
+    """CSV for an export, read through a server-side cursor so memory stays flat"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    async with db.transaction(readonly=True):
+        statement = await db.prepare(EXPORTS[kind])
+        writer.writerow([attribute.name for attribute in statement.get_attributes()])
+        rows = 0
+        async for record in statement.cursor(prefetch=EXPORT_FETCH_SIZE):
+            writer.writerow(record.values())
+            rows += 1
+            if rows % EXPORT_CHUNK_ROWS == 0:
+                yield buffer.getvalue().encode("utf-8")
+                buffer.seek(0)
+                buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+async def export_xlsx(db: asyncpg.Connection, kind: str) -> str:
+    """Write an export to a temporary XLSX file in write-only mode; the caller streams and deletes it"""
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet = workbook.create_sheet(kind)
+    async with db.transaction(readonly=True):
+        statement = await db.prepare(EXPORTS[kind])
+        sheet.append([attribute.name for attribute in statement.get_attributes()])
+        async for record in statement.cursor(prefetch=EXPORT_FETCH_SIZE):
+            sheet.append([float(v) if isinstance(v, Decimal) else v for v in record.values()])
+
+    handle, path = tempfile.mkstemp(suffix=".xlsx")
+    os.close(handle)
+    # Zipping the sheet is CPU-bound; keep it off the event loop
+    await asyncio.to_thread(workbook.save, path)
+    return path
@@ -0,0 +1,61 @@
+from typing import Dict, List, Sequence
+
+# Everything here is identical for every user and turn, so it is rendered once and
+# sent as the system instruction: a stable prefix the provider can cache
+CHAT_SYSTEM_TEMPLATE = """You are LibriPal, an AI-powered library assistant with complete book management capabilities.
+
+Library Rules: Max {max_borrow_days} days borrowing, ₹{fine_per_day}/day fine after due date, Max {max_renewals} renewals, Max {max_books} books issued at once
+
+You can help with:
+1. Book search (set search_query for book searches)
+2. Show issued books (set show_issued to true)
+3. Book renewals (set show_renewals to true)
+4. Fine information (set show_fines to true)
+5. Library information
+
+Each user turn gives the time, the user's library status, recent conversation and their message.
+
+Respond with JSON:
+{{
+    "intent": "book_search|issued_books|renewals|fines|library_info|help",
+    "type": "book_search|issued_books|renewals|fines|library_info|help",
+    "message": "Your helpful response referencing user's current books and fines when relevant",
+    "suggestions": ["suggestion1", "suggestion2", "suggestion3"],
+    "search_query": "search terms if book search needed",
+    "show_issued": false,
+    "show_renewals": false,
+    "show_fines": false
+}}
+
+Be helpful and reference their current library status when relevant!"""
+
+
+def render_system_prompt(max_borrow_days: int, fine_per_day: int, max_renewals: int, max_books: int) -> str:
+    return CHAT_SYSTEM_TEMPLATE.format(
+        max_borrow_days=max_borrow_days, fine_per_day=fine_per_day,
+        max_renewals=max_renewals, max_books=max_books
+    )
+
+
+def render_turn(user_id: str, current_time: str, issued_books: Sequence, total_fine,
+                chat_history: List[Dict], user_message: str) -> str:
+    """The per-request part of the prompt, with empty sections left out"""
+    lines = [f"Time: {current_time} UTC", f"User: {user_id}"]
+    if issued_books:
+        lines.append(f"Issued books ({len(issued_books)}):")
+        lines.extend(
+            f"- {book.book_title} by {book.book_author} (Due: {book.due_date}, Fine: ₹{book.current_fine})"
+            for book in issued_books
+        )
+    else:
+        lines.append("Issued books: none")
+    lines.append(f"Outstanding fines: ₹{total_fine}")
+
+    if chat_history:
+        lines.append("Recent conversation:")
+        for chat in chat_history:
+            lines.append(f"User: {chat['user_message']}")
+            lines.append(f"Assistant: {chat['ai_response'][:80]}...")
+
+    lines.append(f'Message: "{user_message}"')
+    return "\n".join(lines)
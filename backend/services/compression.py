@@ -0,0 +1,173 @@
+import asyncio
+import os
+import zlib
+from typing import Dict, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+
+from services.lazy_import import lazy_module, module_available
+
+# Optional: without brotli only gzip is offered
+brotli = lazy_module("brotli")
+BROTLI_AVAILABLE = module_available("brotli")
+
+# Smaller bodies gain too little to be worth the CPU and the extra header
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+# Fast settings suited to dynamic responses
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 4
+# Chunks this large (exports) are compressed in a worker thread instead of on the event loop
+COMPRESSION_THREAD_BYTES = 256 * 1024
+COMPRESSIBLE_TYPES = ("text/", "application/json", "application/javascript", "application/xml", "image/svg+xml")
+ENCODINGS = ("br", "gzip")
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """br if the client takes it and brotli is installed, else gzip, else nothing"""
+    weights: Dict[str, float] = {}
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        weight = 1.0
+        params = params.strip().replace(" ", "")
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[name.strip().lower()] = weight
+    for encoding in ENCODINGS:
+        if encoding == "br" and not BROTLI_AVAILABLE:
+            continue
+        if weights.get(encoding, weights.get("*", 0)) > 0:
+            return encoding
+    return None
+
+
+def encoded_etag(etag: str, encoding: str) -> str:
+    """ETag of the compressed representation: the encoding appended inside the quotes, W/ kept"""
+    if not etag.endswith('"'):
+        return etag
+    return f'{etag[:-1]}-{encoding}"'
+
+
+def decoded_etag(etag: str) -> str:
+    """The ETag encoded_etag() was given, so validators match whichever encoding the client cached"""
+    for encoding in ENCODINGS:
+        suffix = f'-{encoding}"'
+        if etag.endswith(suffix):
+            return etag[:-len(suffix)] + '"'
+    return etag
+
+
+class StreamCompressor:
+    """gzip or brotli over a sequence of chunks; flush() makes everything so far decodable"""
+
+    def __init__(self, encoding: str):
+        self.encoding = encoding
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=BROTLI_QUALITY)
+        else:
+            self._compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        if self.encoding == "br":
+            body = self._compressor.process(data)
+            return body + (self._compressor.finish() if final else self._compressor.flush())
+        body = self._compressor.compress(data)
+        return body + self._compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+class CompressionMiddleware:
+    """Pure ASGI gzip/brotli compression of text and JSON responses.
+
+    Whole responses are compressed when they reach minimum_size. Streamed ones
+    (CSV exports) are compressed chunk by chunk and flushed after each, so the
+    client keeps receiving data as it is produced. Images and responses that
+    already carry a Content-Encoding pass through untouched.
+
+    A compressed response's ETag gets the encoding appended (see encoded_etag),
+    since its bytes differ from the uncompressed representation's. A 304 echoes
+    the encoded form when that is what the client revalidated with.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESSION_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = choose_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if not encoding:
+            await self.app(scope, receive, send)
+            return
+        if_none_match = Headers(scope=scope).get("if-none-match", "")
+        await self.app(scope, receive, CompressingSender(send, encoding, self.minimum_size, if_none_match))
+
+
+class CompressingSender:
+    def __init__(self, send, encoding: str, minimum_size: int, if_none_match: str = ""):
+        self.send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.if_none_match = if_none_match
+        self.start: Optional[Dict] = None
+        self.compressor: Optional[StreamCompressor] = None
+        self.passthrough = False
+
+    async def _compress(self, data: bytes, final: bool) -> bytes:
+        if len(data) >= COMPRESSION_THREAD_BYTES:
+            return await asyncio.to_thread(self.compressor.compress, data, final)
+        return self.compressor.compress(data, final)
+
+    async def __call__(self, message):
+        if message["type"] == "http.response.start":
+            if message["status"] == 304:
+                await self.send(self._not_modified(message))
+                self.passthrough = True
+                return
+            # Held back until the first body chunk shows whether compressing is worth it
+            self.start = message
+            return
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.compressor is None:
+            headers = MutableHeaders(raw=list(self.start["headers"]))
+            content_type = headers.get("content-type", "")
+            if ("content-encoding" in headers or not content_type.startswith(COMPRESSIBLE_TYPES)
+                    or (not more_body and len(body) < self.minimum_size)):
+                self.passthrough = True
+                await self.send(self.start)
+                await self.send(message)
+                return
+
+            self.compressor = StreamCompressor(self.encoding)
+            body = await self._compress(body, final=not more_body)
+            headers["Content-Encoding"] = self.encoding
+            headers.add_vary_header("Accept-Encoding")
+            if "etag" in headers:
+                headers["ETag"] = encoded_etag(headers["etag"], self.encoding)
+            if more_body:
+                del headers["Content-Length"]
+            else:
+                headers["Content-Length"] = str(len(body))
+            self.start["headers"] = headers.raw
+            await self.send(self.start)
+        else:
+            body = await self._compress(body, final=not more_body)
+        await self.send({"type": "http.response.body", "body": body, "more_body": more_body})
+
+    def _not_modified(self, message: Dict) -> Dict:
+        headers = MutableHeaders(raw=list(message["headers"]))
+        etag = headers.get("etag")
+        if etag:
+            encoded = encoded_etag(etag, self.encoding)
+            if encoded.removeprefix("W/") in (tag.strip().removeprefix("W/") for tag in self.if_none_match.split(",")):
+                headers["ETag"] = encoded
+                message = {**message, "headers": headers.raw}
+        return message
@@ -0,0 +1,255 @@
+import asyncio
+import hashlib
+import io
+import os
+import re
+from typing import Dict, Optional, Tuple
+
+from services.lazy_import import lazy_module, module_available
+
+aiohttp = lazy_module("aiohttp")
+Image = lazy_module("PIL.Image")
+# Thumbnails are optional
+PILLOW_AVAILABLE = module_available("PIL")
+
+API_URL = os.getenv("API_URL", "http://localhost:8000").rstrip("/")
+COVER_CACHE_DIR = os.getenv("COVER_CACHE_DIR", os.path.join(os.path.dirname(os.path.dirname(__file__)), "cover_cache"))
+COVER_CACHE_MAX_BYTES = int(os.getenv("COVER_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+COVER_MAX_IMAGE_BYTES = 5 * 1024 * 1024
+THUMBNAIL_WIDTHS = (64, 128, 256)
+
+# Cover ids are "<source>-<upstream id>"; each source maps to exactly one upstream URL
+COVER_SOURCES = {
+    "ol": (re.compile(r"^\d+$"), "https://covers.openlibrary.org/b/id/{}-M.jpg?default=false"),
+    "itb": (re.compile(r"^\d{10,13}$"), "https://itbook.store/img/books/{}.png"),
+}
+UPSTREAM_PATTERNS = [
+    ("ol", re.compile(r"^https?://covers\.openlibrary\.org/b/id/(\d+)-[SML]\.jpg$")),
+    ("itb", re.compile(r"^https?://itbook\.store/img/books/(\d{10,13})\.png$")),
+]
+CONTENT_TYPES = {
+    b"\xff\xd8\xff": ("image/jpeg", ".jpg"),
+    b"\x89PNG": ("image/png", ".png"),
+    b"GIF8": ("image/gif", ".gif"),
+}
+
+
+def proxied_cover_url(image_url: Optional[str]) -> str:
+    """Rewrite a known third-party cover URL to go through /api/covers"""
+    if not image_url:
+        return ""
+    for source, pattern in UPSTREAM_PATTERNS:
+        match = pattern.match(image_url)
+        if match:
+            return f"{API_URL}/api/covers/{source}-{match.group(1)}"
+    return image_url
+
+
+def cover_id_from_url(url: Optional[str]) -> Optional[str]:
+    """The cover id of a URL produced by proxied_cover_url, if it is one"""
+    prefix = f"{API_URL}/api/covers/"
+    if url and url.startswith(prefix):
+        return url[len(prefix):]
+    return None
+
+
+def sniff_content_type(data: bytes) -> Optional[Tuple[str, str]]:
+    for magic, content_type in CONTENT_TYPES.items():
+        if data.startswith(magic):
+            return content_type
+    return None
+
+
+class CoverCache:
+    """Content-addressed on-disk cover cache with size-bounded LRU eviction.
+
+    Images live under objects/<sha256[:2]>/<sha256><ext>, so identical covers are
+    stored once; refs/<cover key> records which object a cover id resolves to.
+    """
+
+    def __init__(self, root: str = COVER_CACHE_DIR, max_bytes: int = COVER_CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.objects_dir = os.path.join(root, "objects")
+        self.refs_dir = os.path.join(root, "refs")
+        self.session = None
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._total_bytes: Optional[int] = None
+
+    async def get_session(self):
+        if self.session is None or self.session.closed:
+            self.session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=10),
+                headers={'User-Agent': 'LibriPal/1.0 (Library Assistant Bot)'}
+            )
+        return self.session
+
+    @staticmethod
+    def upstream_url(cover_id: str) -> Optional[str]:
+        source, _, upstream_id = cover_id.partition("-")
+        if source not in COVER_SOURCES:
+            return None
+        pattern, url_template = COVER_SOURCES[source]
+        if not pattern.match(upstream_id):
+            return None
+        return url_template.format(upstream_id)
+
+    def _object_path(self, digest: str, ext: str) -> str:
+        return os.path.join(self.objects_dir, digest[:2], f"{digest}{ext}")
+
+    def _ref_path(self, key: str) -> str:
+        return os.path.join(self.refs_dir, key)
+
+    def _read_ref(self, key: str) -> Optional[Tuple[str, str, str]]:
+        """Return (path, digest, content_type) for a cached key, touching it for LRU"""
+        try:
+            with open(self._ref_path(key), encoding="utf-8") as f:
+                digest, ext, content_type = f.read().split()
+        except (OSError, ValueError):
+            return None
+
+        path = self._object_path(digest, ext)
+        try:
+            os.utime(path)
+        except OSError:
+            return None  # Object was evicted
+        return path, digest, content_type
+
+    def _write(self, key: str, data: bytes, content_type: str, ext: str) -> Tuple[str, str, str]:
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._object_path(digest, ext)
+
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            if self._total_bytes is not None:
+                self._total_bytes += len(data)
+
+        os.makedirs(self.refs_dir, exist_ok=True)
+        ref_tmp = f"{self._ref_path(key)}.{os.getpid()}.tmp"
+        with open(ref_tmp, "w", encoding="utf-8") as f:
+            f.write(f"{digest} {ext} {content_type}")
+        os.replace(ref_tmp, self._ref_path(key))
+
+        self._evict_if_needed()
+        return path, digest, content_type
+
+    def _scan_objects(self):
+        entries = []
+        for dirpath, _, filenames in os.walk(self.objects_dir):
+            for filename in filenames:
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _evict_if_needed(self):
+        if self._total_bytes is None:
+            self._total_bytes = sum(size for _, size, _ in self._scan_objects())
+        if self._total_bytes <= self.max_bytes:
+            return
+
+        # Evict least recently used objects down to 90% of the budget; dangling refs read as misses
+        target = int(self.max_bytes * 0.9)
+        entries = sorted(self._scan_objects())
+        self._total_bytes = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if self._total_bytes <= target:
+                break
+            try:
+                os.remove(path)
+                self._total_bytes -= size
+            except OSError:
+                pass
+        print(f"🧹 Cover cache evicted down to {self._total_bytes} bytes")
+
+    async def _fetch(self, cover_id: str) -> Optional[Tuple[str, str, str]]:
+        url = self.upstream_url(cover_id)
+        if not url:
+            return None
+
+        try:
+            session = await self.get_session()
+            async with session.get(url) as response:
+                if response.status != 200 or (response.content_length or 0) > COVER_MAX_IMAGE_BYTES:
+                    return None
+                data = await response.read()
+        except Exception as e:
+            print(f"❌ Cover fetch error for {cover_id}: {e}")
+            return None
+
+        sniffed = sniff_content_type(data)
+        if not sniffed or len(data) > COVER_MAX_IMAGE_BYTES:
+            return None
+
+        content_type, ext = sniffed
+        return await asyncio.to_thread(self._write, cover_id, data, content_type, ext)
+
+    def _resize(self, source_path: str, width: int) -> Tuple[bytes, str, str]:
+        with Image.open(source_path) as image:
+            if image.width > width:
+                height = max(1, round(image.height * width / image.width))
+                image = image.resize((width, height), Image.LANCZOS)
+            output = io.BytesIO()
+            image.convert("RGB").save(output, format="JPEG", quality=85, optimize=True)
+        return output.getvalue(), "image/jpeg", ".jpg"
+
+    async def _thumbnail(self, cover_id: str, width: int) -> Optional[Tuple[str, str, str]]:
+        original = await self.get(cover_id)
+        if not original:
+            return None
+        data, content_type, ext = await asyncio.to_thread(self._resize, original[0], width)
+        return await asyncio.to_thread(self._write, f"{cover_id}@w{width}", data, content_type, ext)
+
+    async def get(self, cover_id: str, width: Optional[int] = None) -> Optional[Tuple[str, str, str]]:
+        """Return (path, etag digest, content_type), fetching from upstream at most once per key"""
+        if width and (not PILLOW_AVAILABLE or width not in THUMBNAIL_WIDTHS):
+            width = None
+        key = f"{cover_id}@w{width}" if width else cover_id
+
+        cached = await asyncio.to_thread(self._read_ref, key)
+        if cached:
+            return cached
+
+        # Coalesce concurrent misses for the same key into a single upstream fetch
+        if key in self._inflight:
+            return await asyncio.shield(self._inflight[key])
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await (self._thumbnail(cover_id, width) if width else self._fetch(cover_id))
+            future.set_result(result)
+            return result
+        except Exception as e:
+            print(f"❌ Cover cache error for {key}: {e}")
+            future.set_result(None)
+            return None
+        finally:
+            # A cancelled leader skips both set_result calls; resolve the future so waiters don't hang
+            if not future.done():
+                future.set_result(None)
+            del self._inflight[key]
+
+    async def read(self, path: str) -> Optional[bytes]:
+        """Bytes of a cached object, or None if it was evicted since get() returned its path"""
+        def read_file() -> bytes:
+            with open(path, "rb") as f:
+                return f.read()
+        try:
+            return await asyncio.to_thread(read_file)
+        except FileNotFoundError:
+            return None
+
+    async def close(self):
+        if self.session and not self.session.closed:
+            await self.session.close()
+
+
+cover_cache = CoverCache()
@@ -0,0 +1,317 @@
+import os
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import asyncpg
+
+# Copies stocked for a title the first time it is issued or looked up from the live catalog
+DEFAULT_COPIES_PER_TITLE = int(os.getenv("DEFAULT_COPIES_PER_TITLE", "1"))
+
+
+class InventoryService:
+    """Copy-level inventory: one book_copies row per physical copy plus counters in book_inventory.
+
+    Copy status is 'available', 'on_loan', 'on_hold' (set aside for a reservation) or
+    'withdrawn' (retired by an admin; kept because past loans still reference it).
+    available_copies always equals the number of 'available' copies and is updated in
+    the same statement chain as the copy row, inside the caller's transaction. Every
+    open loan names the copy it holds in issued_books.copy_id.
+    """
+
+    def __init__(self, default_copies: int = DEFAULT_COPIES_PER_TITLE):
+        self.default_copies = default_copies
+
+    async def init_tables(self, db: asyncpg.Connection):
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS book_inventory (
+                book_id VARCHAR(255) PRIMARY KEY,
+                title VARCHAR(500) NOT NULL,
+                author VARCHAR(500) NOT NULL,
+                total_copies INTEGER NOT NULL DEFAULT 1,
+                available_copies INTEGER NOT NULL DEFAULT 1,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                CHECK (available_copies >= 0 AND available_copies <= total_copies)
+            )
+        """)
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS book_copies (
+                id SERIAL PRIMARY KEY,
+                book_id VARCHAR(255) NOT NULL REFERENCES book_inventory(book_id) ON DELETE CASCADE,
+                copy_number INTEGER NOT NULL,
+                status VARCHAR(20) NOT NULL DEFAULT 'available',
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                UNIQUE (book_id, copy_number)
+            )
+        """)
+        await db.execute("""
+            CREATE INDEX IF NOT EXISTS idx_book_copies_status
+            ON book_copies (book_id, status)
+        """)
+        await db.execute("ALTER TABLE issued_books ADD COLUMN IF NOT EXISTS copy_id INTEGER REFERENCES book_copies(id)")
+
+        # Stock every title that already has loans so existing issues count against its copies
+        await db.execute("""
+            INSERT INTO book_inventory (book_id, title, author, total_copies, available_copies)
+            SELECT book_id, MAX(book_title), MAX(book_author),
+                   GREATEST(COUNT(*), $1), GREATEST($1 - COUNT(*), 0)
+            FROM issued_books
+            WHERE status = 'issued'
+            GROUP BY book_id
+            ON CONFLICT (book_id) DO NOTHING
+        """, self.default_copies)
+        await self._create_missing_copies(db)
+        await self._assign_open_loan_copies(db)
+
+    async def _create_missing_copies(self, db: asyncpg.Connection, book_ids: Optional[List[str]] = None):
+        # Copies beyond the available count start out on loan, matching the seeded counters
+        await db.execute("""
+            INSERT INTO book_copies (book_id, copy_number, status)
+            SELECT i.book_id, n,
+                   CASE WHEN n <= i.total_copies - i.available_copies THEN 'on_loan' ELSE 'available' END
+            FROM book_inventory i
+            CROSS JOIN LATERAL generate_series(1, i.total_copies) AS n
+            WHERE $1::VARCHAR[] IS NULL OR i.book_id = ANY($1::VARCHAR[])
+            ON CONFLICT (book_id, copy_number) DO NOTHING
+        """, book_ids)
+
+    async def _assign_open_loan_copies(self, db: asyncpg.Connection, book_ids: Optional[List[str]] = None):
+        """Backfill copy_id on open loans from before copy tracking (or from an import).
+
+        Each such loan is paired with a distinct on-loan copy that no other open loan
+        names, oldest loan to lowest copy number, so check-in always releases its own copy.
+        """
+        await db.execute("""
+            WITH unassigned AS (
+                SELECT id, book_id, row_number() OVER (PARTITION BY book_id ORDER BY issue_date, id) AS n
+                FROM issued_books
+                WHERE status = 'issued' AND copy_id IS NULL
+                  AND ($1::VARCHAR[] IS NULL OR book_id = ANY($1::VARCHAR[]))
+            ), unclaimed AS (
+                SELECT bc.id, bc.book_id, row_number() OVER (PARTITION BY bc.book_id ORDER BY bc.copy_number) AS n
+                FROM book_copies bc
+                WHERE bc.status = 'on_loan'
+                  AND ($1::VARCHAR[] IS NULL OR bc.book_id = ANY($1::VARCHAR[]))
+                  AND NOT EXISTS (
+                      SELECT 1 FROM issued_books ib WHERE ib.copy_id = bc.id AND ib.status = 'issued'
+                  )
+            )
+            UPDATE issued_books ib SET copy_id = unclaimed.id
+            FROM unassigned
+            JOIN unclaimed ON unclaimed.book_id = unassigned.book_id AND unclaimed.n = unassigned.n
+            WHERE ib.id = unassigned.id
+        """, book_ids)
+
+    async def ensure_title(self, db: asyncpg.Connection, book_id: str, title: str, author: str) -> bool:
+        """Stock a catalog title with the default number of copies if it isn't tracked yet; True if it was new"""
+        created = await db.fetchval("""
+            INSERT INTO book_inventory (book_id, title, author, total_copies, available_copies)
+            VALUES ($1, $2, $3, $4, $4)
+            ON CONFLICT (book_id) DO NOTHING
+            RETURNING book_id
+        """, book_id, title, author, self.default_copies)
+        if created:
+            await self._create_missing_copies(db, [book_id])
+        return bool(created)
+
+    async def absorb_open_loans(self, db: asyncpg.Connection, loans: Iterable[Tuple[str, str, str, int]]):
+        """Account for open loans loaded in bulk: (book_id, title, author, loan count) per title.
+
+        Each title is stocked if new, gains copies if it has fewer than it has loans,
+        and has that many copies marked on loan; counters are then recounted from the
+        copies. Caller runs this in the import transaction.
+        """
+        loans = list(loans)
+        if not loans:
+            return
+        book_ids = [loan[0] for loan in loans]
+        counts = [loan[3] for loan in loans]
+
+        await db.execute("""
+            INSERT INTO book_inventory (book_id, title, author, total_copies, available_copies)
+            SELECT book_id, title, author, $4, $4
+            FROM unnest($1::VARCHAR[], $2::VARCHAR[], $3::VARCHAR[]) AS l(book_id, title, author)
+            ON CONFLICT (book_id) DO NOTHING
+        """, book_ids, [loan[1] for loan in loans], [loan[2] for loan in loans], self.default_copies)
+        await self._create_missing_copies(db, book_ids)
+
+        # Top up shelf copies to cover the loans, then lend that many of them
+        await db.execute("""
+            INSERT INTO book_copies (book_id, copy_number, status)
+            SELECT l.book_id, c.max_copy_number + n, 'available'
+            FROM unnest($1::VARCHAR[], $2::INTEGER[]) AS l(book_id, loans)
+            CROSS JOIN LATERAL (
+                SELECT COALESCE(MAX(copy_number), 0) AS max_copy_number,
+                       COUNT(*) FILTER (WHERE status = 'available') AS available
+                FROM book_copies WHERE book_id = l.book_id
+            ) c
+            CROSS JOIN LATERAL generate_series(1, l.loans - c.available) AS n
+        """, book_ids, counts)
+        await db.execute("""
+            UPDATE book_copies SET status = 'on_loan', updated_at = CURRENT_TIMESTAMP
+            FROM (
+                SELECT bc.id, l.loans,
+                       row_number() OVER (PARTITION BY bc.book_id ORDER BY bc.copy_number) AS position
+                FROM book_copies bc
+                JOIN unnest($1::VARCHAR[], $2::INTEGER[]) AS l(book_id, loans) ON l.book_id = bc.book_id
+                WHERE bc.status = 'available'
+            ) lent
+            WHERE book_copies.id = lent.id AND lent.position <= lent.loans
+        """, book_ids, counts)
+        await db.execute("""
+            UPDATE book_inventory i
+            SET total_copies = c.total, available_copies = c.available, updated_at = CURRENT_TIMESTAMP
+            FROM (
+                SELECT book_id, COUNT(*) FILTER (WHERE status <> 'withdrawn') AS total,
+                       COUNT(*) FILTER (WHERE status = 'available') AS available
+                FROM book_copies
+                WHERE book_id = ANY($1::VARCHAR[])
+                GROUP BY book_id
+            ) c
+            WHERE i.book_id = c.book_id
+        """, book_ids)
+        await self._assign_open_loan_copies(db, book_ids)
+
+    async def _take_copy(self, db: asyncpg.Connection, book_id: str, from_status: str,
+                         to_status: str = 'on_loan') -> Optional[int]:
+        return await db.fetchval("""
+            UPDATE book_copies SET status = $3, updated_at = CURRENT_TIMESTAMP
+            WHERE id = (
+                SELECT id FROM book_copies
+                WHERE book_id = $1 AND status = $2
+                ORDER BY copy_number
+                LIMIT 1
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING id
+        """, book_id, from_status, to_status)
+
+    async def checkout_copy(self, db: asyncpg.Connection, book_id: str, to_status: str = 'on_loan') -> Optional[int]:
+        """Claim an available copy for a loan (or a hold, with to_status='on_hold'); None when every copy is out"""
+        # The copy row is claimed first so the counter only moves when a copy actually went out
+        copy_id = await self._take_copy(db, book_id, 'available', to_status)
+        if copy_id is None:
+            return None
+        decremented = await db.fetchval("""
+            UPDATE book_inventory
+            SET available_copies = available_copies - 1, updated_at = CURRENT_TIMESTAMP
+            WHERE book_id = $1 AND available_copies > 0
+            RETURNING available_copies
+        """, book_id)
+        if decremented is None:
+            # Counter and copies disagree; raising rolls back the caller's transaction, copy claim included
+            raise RuntimeError(f"Inventory counter for {book_id} is out of step with its copies")
+        return copy_id
+
+    async def checkout_held_copy(self, db: asyncpg.Connection, book_id: str) -> Optional[int]:
+        """Lend the copy set aside for a ready reservation (counters don't change)"""
+        return await self._take_copy(db, book_id, 'on_hold')
+
+    async def checkin_copy(self, db: asyncpg.Connection, book_id: str, copy_id: Optional[int], hold: bool = False):
+        """Return a loaned copy to the shelf, or set it aside when a reservation was promoted"""
+        if copy_id is None:
+            # init_tables gives every open loan a copy; one without is a loan no copy was left for
+            print(f"⚠️ Returned loan of {book_id} names no copy; inventory left unchanged")
+            return
+
+        new_status = 'on_hold' if hold else 'available'
+        released = await db.fetchval("""
+            UPDATE book_copies SET status = $2, updated_at = CURRENT_TIMESTAMP
+            WHERE id = $1 AND status = 'on_loan'
+            RETURNING id
+        """, copy_id, new_status)
+        if released and not hold:
+            await self._increment_available(db, book_id)
+
+    async def release_held_copy(self, db: asyncpg.Connection, book_id: str):
+        """Put a copy that was on hold for a lapsed reservation back on the shelf"""
+        released = await db.fetchval("""
+            UPDATE book_copies SET status = 'available', updated_at = CURRENT_TIMESTAMP
+            WHERE id = (
+                SELECT id FROM book_copies
+                WHERE book_id = $1 AND status = 'on_hold'
+                ORDER BY copy_number
+                LIMIT 1
+                FOR UPDATE SKIP LOCKED
+            )
+            RETURNING id
+        """, book_id)
+        if released:
+            await self._increment_available(db, book_id)
+
+    async def _increment_available(self, db: asyncpg.Connection, book_id: str):
+        await db.execute("""
+            UPDATE book_inventory
+            SET available_copies = available_copies + 1, updated_at = CURRENT_TIMESTAMP
+            WHERE book_id = $1
+        """, book_id)
+
+    async def set_total_copies(self, db: asyncpg.Connection, book_id: str, title: str, author: str,
+                               total_copies: int) -> Optional[asyncpg.Record]:
+        """Add copies, or withdraw shelf copies, so the title has total_copies; caller runs this in a transaction.
+
+        Withdrawn copies are retired, not deleted, since returned loans still reference
+        them; adding copies brings retired ones back before numbering new ones.
+        """
+        await self.ensure_title(db, book_id, title, author)
+        current = await db.fetchrow(
+            "SELECT total_copies, available_copies FROM book_inventory WHERE book_id = $1 FOR UPDATE",
+            book_id
+        )
+        delta = total_copies - current['total_copies']
+
+        if delta > 0:
+            restored = await db.fetchval("""
+                WITH restored AS (
+                    UPDATE book_copies SET status = 'available', updated_at = CURRENT_TIMESTAMP
+                    WHERE id IN (
+                        SELECT id FROM book_copies
+                        WHERE book_id = $1 AND status = 'withdrawn'
+                        ORDER BY copy_number
+                        LIMIT $2
+                    )
+                    RETURNING 1
+                )
+                SELECT COUNT(*) FROM restored
+            """, book_id, delta)
+            if delta > restored:
+                await db.execute("""
+                    INSERT INTO book_copies (book_id, copy_number, status)
+                    SELECT $1, (SELECT COALESCE(MAX(copy_number), 0) FROM book_copies WHERE book_id = $1) + n, 'available'
+                    FROM generate_series(1, $2) AS n
+                """, book_id, delta - restored)
+        elif delta < 0:
+            # Only copies sitting on the shelf can be withdrawn
+            if -delta > current['available_copies']:
+                return None
+            await db.execute("""
+                UPDATE book_copies SET status = 'withdrawn', updated_at = CURRENT_TIMESTAMP
+                WHERE id IN (
+                    SELECT id FROM book_copies
+                    WHERE book_id = $1 AND status = 'available'
+                    ORDER BY copy_number DESC
+                    LIMIT $2
+                )
+            """, book_id, -delta)
+
+        return await db.fetchrow("""
+            UPDATE book_inventory
+            SET total_copies = total_copies + $2, available_copies = available_copies + $2,
+                title = $3, author = $4, updated_at = CURRENT_TIMESTAMP
+            WHERE book_id = $1
+            RETURNING *
+        """, book_id, delta, title, author)
+
+    async def availability(self, db: asyncpg.Connection, book_ids: Iterable[str]) -> Dict[str, Tuple[int, int]]:
+        """(available, total) for a whole page of books in one query; untracked titles get the default stock"""
+        book_ids = list(dict.fromkeys(book_ids))
+        result = {book_id: (self.default_copies, self.default_copies) for book_id in book_ids}
+        if not book_ids:
+            return result
+
+        rows = await db.fetch("""
+            SELECT book_id, available_copies, total_copies
+            FROM book_inventory
+            WHERE book_id = ANY($1::VARCHAR[])
+        """, book_ids)
+        for row in rows:
+            result[row['book_id']] = (row['available_copies'], row['total_copies'])
+        return result
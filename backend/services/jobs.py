@@ -0,0 +1,236 @@
+import asyncio
+import json
+import os
+import random
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+import asyncpg
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "10000"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "5"))
+JOB_RETRY_BASE_SECONDS = float(os.getenv("JOB_RETRY_BASE_SECONDS", "1"))
+JOB_RETRY_MAX_SECONDS = 300.0
+# With JOB_OUTBOX=true jobs are written to Postgres first and survive restarts
+JOB_OUTBOX = os.getenv("JOB_OUTBOX", "false").lower() == "true"
+OUTBOX_POLL_SECONDS = 2.0
+OUTBOX_BATCH_SIZE = 50
+OUTBOX_LOCK_TIMEOUT = "5 minutes"
+# The outbox has its own small pool so job traffic never waits behind request queries
+JOB_DB_POOL_SIZE = int(os.getenv("JOB_DB_POOL_SIZE", "2"))
+
+JobHandler = Callable[..., Awaitable[Any]]
+
+
+class JobQueue:
+    """In-process background jobs for side effects that shouldn't delay responses.
+
+    Jobs run on a fixed pool of worker tasks and are retried with exponential
+    backoff and jitter. When the durable outbox is enabled, enqueue inserts a
+    job_outbox row and a poller claims due rows with SKIP LOCKED and hands them
+    to the same workers, so pending work survives restarts and is shared
+    between API processes. Outbox
+    statements run on a pool of the queue's own, separate from the API's.
+    """
+
+    def __init__(self, database_url: str, workers: int = JOB_WORKERS, maxsize: int = JOB_QUEUE_SIZE,
+                 max_attempts: int = JOB_MAX_ATTEMPTS, durable: bool = JOB_OUTBOX, pool_size: int = JOB_DB_POOL_SIZE):
+        self.database_url = database_url
+        self.pool_size = pool_size
+        self._pool: Optional[asyncpg.Pool] = None
+        self._pool_lock = asyncio.Lock()
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.durable = durable
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=maxsize)
+        self._handlers: Dict[str, JobHandler] = {}
+        self._durable_jobs = set()
+        self._tasks = []
+        self._outbox_wakeup = asyncio.Event()
+
+    def register(self, name: str, durable: bool = True):
+        """Register a job handler; durable=False keeps jobs that touch process-local state out of the outbox"""
+        def decorator(handler: JobHandler) -> JobHandler:
+            self._handlers[name] = handler
+            if durable:
+                self._durable_jobs.add(name)
+            return handler
+        return decorator
+
+    async def get_pool(self) -> Optional[asyncpg.Pool]:
+        if self._pool is None:
+            async with self._pool_lock:
+                if self._pool is None:
+                    try:
+                        self._pool = await asyncpg.create_pool(self.database_url, min_size=1, max_size=self.pool_size)
+                    except Exception as e:
+                        print(f"⚠️ Job queue could not connect to the database: {e}")
+        return self._pool
+
+    @staticmethod
+    def backoff(attempt: int) -> float:
+        delay = min(JOB_RETRY_BASE_SECONDS * 2 ** (attempt - 1), JOB_RETRY_MAX_SECONDS)
+        return delay * random.uniform(0.5, 1.0)
+
+    async def init_tables(self, db):
+        if not self.durable:
+            return
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS job_outbox (
+                id BIGSERIAL PRIMARY KEY,
+                name VARCHAR(100) NOT NULL,
+                payload JSONB NOT NULL DEFAULT '{}',
+                status VARCHAR(20) NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                run_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                locked_at TIMESTAMP,
+                last_error TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        await db.execute("""
+            CREATE INDEX IF NOT EXISTS idx_job_outbox_due
+            ON job_outbox (run_at) WHERE status IN ('pending', 'running')
+        """)
+
+    async def enqueue(self, name: str, **payload) -> bool:
+        """Schedule a job; returns False if it had to be dropped"""
+        if name not in self._handlers:
+            raise ValueError(f"Unknown job: {name}")
+
+        if self.durable and name in self._durable_jobs:
+            try:
+                pool = await self.get_pool()
+                if pool:
+                    await pool.execute(
+                        "INSERT INTO job_outbox (name, payload) VALUES ($1, $2::jsonb)",
+                        name, json.dumps(payload, default=str)
+                    )
+                    self._outbox_wakeup.set()
+                    return True
+            except Exception as e:
+                print(f"⚠️ Outbox write failed for {name}, running in memory: {e}")
+
+        try:
+            self._queue.put_nowait((name, payload, 1, None))
+            return True
+        except asyncio.QueueFull:
+            print(f"❌ Job queue full, dropping {name}")
+            return False
+
+    def _retry_later(self, name: str, payload: Dict, attempt: int):
+        def requeue():
+            try:
+                self._queue.put_nowait((name, payload, attempt, None))
+            except asyncio.QueueFull:
+                print(f"❌ Job queue full, dropping retry of {name}")
+        asyncio.get_running_loop().call_later(self.backoff(attempt - 1), requeue)
+
+    async def _worker(self):
+        while True:
+            # finished is set for outbox jobs, whose retries are tracked in the table instead
+            name, payload, attempt, finished = await self._queue.get()
+            try:
+                if finished is not None:
+                    await self._run_outbox_job(payload)
+                else:
+                    await self._handlers[name](**payload)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if finished is not None:
+                    print(f"❌ Outbox job {name} could not be recorded: {e}")
+                elif attempt < self.max_attempts:
+                    print(f"⚠️ Job {name} failed (attempt {attempt}/{self.max_attempts}): {e}")
+                    self._retry_later(name, payload, attempt + 1)
+                else:
+                    print(f"❌ Job {name} gave up after {attempt} attempts: {e}")
+            finally:
+                if finished is not None and not finished.done():
+                    finished.set_result(None)
+                self._queue.task_done()
+
+    async def _run_outbox_job(self, job):
+        pool = await self.get_pool()
+        try:
+            payload = job['payload']
+            if isinstance(payload, str):
+                payload = json.loads(payload)
+            await self._handlers[job['name']](**payload)
+            await pool.execute("DELETE FROM job_outbox WHERE id = $1", job['id'])
+        except Exception as e:
+            attempts = job['attempts'] + 1
+            await pool.execute("""
+                UPDATE job_outbox
+                SET status = CASE WHEN $2 >= $3 THEN 'failed' ELSE 'pending' END,
+                    attempts = $2,
+                    run_at = CURRENT_TIMESTAMP + make_interval(secs => $4),
+                    locked_at = NULL,
+                    last_error = $5
+                WHERE id = $1
+            """, job['id'], attempts, self.max_attempts, self.backoff(attempts), str(e)[:1000])
+            print(f"⚠️ Outbox job {job['name']} failed (attempt {attempts}/{self.max_attempts}): {e}")
+
+    async def _outbox_poller(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._outbox_wakeup.wait(), timeout=OUTBOX_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                pass
+            self._outbox_wakeup.clear()
+
+            try:
+                pool = await self.get_pool()
+                if not pool:
+                    continue
+                # Claiming is one statement, so no transaction or connection is held while jobs run
+                jobs = await pool.fetch(f"""
+                    UPDATE job_outbox SET status = 'running', locked_at = CURRENT_TIMESTAMP
+                    WHERE id IN (
+                        SELECT id FROM job_outbox
+                        WHERE run_at <= CURRENT_TIMESTAMP
+                          AND (status = 'pending'
+                               OR (status = 'running' AND locked_at < CURRENT_TIMESTAMP - INTERVAL '{OUTBOX_LOCK_TIMEOUT}'))
+                        ORDER BY run_at
+                        LIMIT $1
+                        FOR UPDATE SKIP LOCKED
+                    )
+                    RETURNING *
+                """, OUTBOX_BATCH_SIZE)
+                # Claimed jobs run on the worker pool; the next claim waits for this batch so
+                # claimed rows never sit in memory long enough for their lock to time out
+                batch = []
+                for job in jobs:
+                    finished = asyncio.get_running_loop().create_future()
+                    await self._queue.put((job['name'], job, job['attempts'] + 1, finished))
+                    batch.append(finished)
+                await asyncio.gather(*batch)
+                if len(jobs) == OUTBOX_BATCH_SIZE:
+                    self._outbox_wakeup.set()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"❌ Outbox poller error: {e}")
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        if self.durable:
+            self._tasks.append(asyncio.create_task(self._outbox_poller()))
+        print(f"✅ Job queue started with {self.workers} workers{' and durable outbox' if self.durable else ''}")
+
+    async def stop(self, drain_timeout: float = 5.0):
+        """Give queued in-memory jobs a moment to finish, then cancel the workers"""
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=drain_timeout)
+        except asyncio.TimeoutError:
+            print(f"⚠️ Job queue stopped with {self._queue.qsize()} jobs pending")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+
+    def stats(self) -> Dict[str, Optional[int]]:
+        return {"queued": self._queue.qsize(), "workers": len(self._tasks)}
@@ -0,0 +1,52 @@
+import importlib
+import importlib.util
+import time
+from functools import lru_cache
+from types import ModuleType
+from typing import Iterable
+
+
+@lru_cache(maxsize=None)
+def module_available(name: str) -> bool:
+    """Whether a module can be imported, without importing it"""
+    try:
+        return importlib.util.find_spec(name) is not None
+    except ModuleNotFoundError:
+        return False
+
+
+class LazyModule(ModuleType):
+    """Stands in for a module and imports it on first attribute access.
+
+    Heavy dependencies (numpy, scipy, aiohttp, ...) then cost nothing at
+    startup and are paid for by the first request, or by preload() after
+    the service is ready.
+    """
+
+    def __init__(self, name: str):
+        super().__init__(name)
+        self._module = None
+
+    def _load(self) -> ModuleType:
+        if self._module is None:
+            self._module = importlib.import_module(self.__name__)
+        return self._module
+
+    def __getattr__(self, attribute: str):
+        return getattr(self._load(), attribute)
+
+
+_lazy_modules = {}
+
+
+def lazy_module(name: str) -> LazyModule:
+    return _lazy_modules.setdefault(name, LazyModule(name))
+
+
+def preload(names: Iterable[str]):
+    """Import lazy modules now, e.g. from a background thread once startup is done"""
+    for name in names:
+        if module_available(name.split(".")[0]):
+            started = time.perf_counter()
+            lazy_module(name)._load()
+            print(f"📦 Loaded {name} in {(time.perf_counter() - started) * 1000:.0f}ms")
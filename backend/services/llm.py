@@ -0,0 +1,237 @@
+import abc
+import asyncio
+import hashlib
+import json
+import os
+import random
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from services.lazy_import import lazy_module
+
+aiohttp = lazy_module("aiohttp")
+
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-1.5-flash")
+GEMINI_API_URL = os.getenv("GEMINI_API_URL", "https://generativelanguage.googleapis.com/v1beta")
+# "gemini" talks to the API; "fake" answers locally for tests and load benchmarks
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "gemini").lower()
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "20"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+FAKE_LLM_LATENCY_MS = float(os.getenv("FAKE_LLM_LATENCY_MS", "0"))
+# Explicit context caching of the system instruction; the API rejects prefixes below its minimum size
+LLM_CONTEXT_CACHE = os.getenv("LLM_CONTEXT_CACHE", "false").lower() == "true"
+LLM_CONTEXT_CACHE_TTL_SECONDS = int(os.getenv("LLM_CONTEXT_CACHE_TTL_SECONDS", "3600"))
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+RETRY_BASE_SECONDS = 0.5
+
+
+class LLMError(Exception):
+    """The model call failed after retries or returned something unusable"""
+
+
+@dataclass
+class LLMResponse:
+    text: str
+    prompt_tokens: int = 0
+    output_tokens: int = 0
+    cached_tokens: int = 0
+
+
+class LLMClient(abc.ABC):
+    """Async text generation. Implementations must be safe to cancel mid-call.
+
+    system_instruction carries the static part of a prompt and prompt the
+    per-request part, so providers can reuse the former across calls.
+    """
+
+    description = "LLM"
+
+    def __init__(self):
+        self.usage: Counter = Counter()
+
+    def _record(self, response: LLMResponse) -> LLMResponse:
+        self.usage["requests"] += 1
+        self.usage["prompt_tokens"] += response.prompt_tokens
+        self.usage["cached_tokens"] += response.cached_tokens
+        self.usage["output_tokens"] += response.output_tokens
+        return response
+
+    @abc.abstractmethod
+    async def generate(self, prompt: str, generation_config: Optional[Dict[str, Any]] = None,
+                       system_instruction: Optional[str] = None) -> LLMResponse:
+        ...
+
+    async def close(self):
+        pass
+
+
+class GeminiClient(LLMClient):
+    """Gemini over its REST API on a pooled aiohttp session.
+
+    Nothing blocks a thread while waiting on the model, and cancelling the
+    calling task (e.g. when the HTTP client disconnects) aborts the request.
+    """
+
+    def __init__(self, api_key: str, model: str = GEMINI_MODEL, timeout: float = LLM_TIMEOUT_SECONDS,
+                 max_retries: int = LLM_MAX_RETRIES, context_cache: bool = LLM_CONTEXT_CACHE):
+        super().__init__()
+        self.api_key = api_key
+        self.model = model
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.description = f"Gemini {model}"
+        self.context_cache = context_cache
+        self._session: Optional["aiohttp.ClientSession"] = None
+        self._cached_contents: Dict[str, Tuple[str, float]] = {}
+        self._cache_lock = asyncio.Lock()
+
+    def _get_session(self) -> "aiohttp.ClientSession":
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=32, keepalive_timeout=60),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers={"x-goog-api-key": self.api_key}
+            )
+        return self._session
+
+    @staticmethod
+    def _retry_delay(attempt: int, retry_after: Optional[str] = None) -> float:
+        if retry_after and retry_after.isdigit():
+            return float(retry_after)
+        return RETRY_BASE_SECONDS * 2 ** attempt * random.uniform(0.5, 1.0)
+
+    @staticmethod
+    def _parse(payload: Dict) -> LLMResponse:
+        candidates = payload.get("candidates") or []
+        if not candidates:
+            reason = payload.get("promptFeedback", {}).get("blockReason", "no candidates")
+            raise LLMError(f"Gemini returned no text ({reason})")
+        parts = candidates[0].get("content", {}).get("parts", [])
+        usage = payload.get("usageMetadata", {})
+        return LLMResponse(
+            text="".join(part.get("text", "") for part in parts),
+            prompt_tokens=usage.get("promptTokenCount", 0),
+            output_tokens=usage.get("candidatesTokenCount", 0),
+            cached_tokens=usage.get("cachedContentTokenCount", 0)
+        )
+
+    async def _cached_content(self, system_instruction: str) -> Optional[str]:
+        """Name of a provider-side cache holding system_instruction, created on first use"""
+        key = hashlib.sha256(system_instruction.encode()).hexdigest()
+        async with self._cache_lock:
+            cached = self._cached_contents.get(key)
+            # Recreate a little early so requests never reference an expired cache
+            if cached and cached[1] - time.monotonic() > 60:
+                return cached[0]
+
+            try:
+                async with self._get_session().post(f"{GEMINI_API_URL}/cachedContents", json={
+                    "model": f"models/{self.model}",
+                    "systemInstruction": {"parts": [{"text": system_instruction}]},
+                    "ttl": f"{LLM_CONTEXT_CACHE_TTL_SECONDS}s"
+                }) as response:
+                    payload = await response.json(content_type=None)
+                    status = response.status
+            except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as e:
+                # Transient: this request goes inline and the next one tries caching again
+                print(f"⚠️ Gemini context cache request failed, sending the prompt prefix inline: {e!r}")
+                return None
+
+            if status != 200:
+                message = (payload or {}).get("error", {}).get("message", "")
+                if status == 400 and "too small" in message.lower():
+                    # The prefix is below the minimum cacheable size and always will be; stop asking
+                    print(f"⚠️ Gemini context caching unavailable, sending the prompt prefix inline: {message}")
+                    self.context_cache = False
+                else:
+                    print(f"⚠️ Gemini context cache returned {status}, sending the prompt prefix inline: {message}")
+                return None
+
+            self._cached_contents[key] = (payload["name"], time.monotonic() + LLM_CONTEXT_CACHE_TTL_SECONDS)
+            print(f"✅ Gemini context cache {payload['name']} created")
+            return payload["name"]
+
+    async def generate(self, prompt: str, generation_config: Optional[Dict[str, Any]] = None,
+                       system_instruction: Optional[str] = None) -> LLMResponse:
+        url = f"{GEMINI_API_URL}/models/{self.model}:generateContent"
+        body: Dict[str, Any] = {"contents": [{"role": "user", "parts": [{"text": prompt}]}]}
+        if generation_config:
+            body["generationConfig"] = generation_config
+        if system_instruction:
+            cached_content = await self._cached_content(system_instruction) if self.context_cache else None
+            if cached_content:
+                body["cachedContent"] = cached_content
+            else:
+                body["systemInstruction"] = {"parts": [{"text": system_instruction}]}
+
+        session = self._get_session()
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            try:
+                async with session.post(url, json=body) as response:
+                    if response.status in RETRYABLE_STATUSES and not last_attempt:
+                        delay = self._retry_delay(attempt, response.headers.get("Retry-After"))
+                        print(f"⚠️ Gemini returned {response.status}, retrying in {delay:.1f}s")
+                        await asyncio.sleep(delay)
+                        continue
+                    payload = await response.json(content_type=None)
+                    if response.status != 200:
+                        message = (payload or {}).get("error", {}).get("message", "")
+                        raise LLMError(f"Gemini returned {response.status}: {message}")
+                    return self._record(self._parse(payload))
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                if last_attempt:
+                    raise LLMError(f"Gemini request failed: {e!r}") from e
+                delay = self._retry_delay(attempt)
+                print(f"⚠️ Gemini request failed ({e!r}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+        raise LLMError("Gemini request failed")
+
+    async def close(self):
+        if self._session and not self._session.closed:
+            await self._session.close()
+
+
+class FakeLLMClient(LLMClient):
+    """Local stand-in that answers with a canned JSON reply after an optional delay"""
+
+    description = "fake LLM"
+
+    def __init__(self, reply: Optional[Callable[[str], str]] = None, latency_ms: float = FAKE_LLM_LATENCY_MS):
+        super().__init__()
+        self.reply = reply or self.default_reply
+        self.latency_ms = latency_ms
+        self.calls = 0
+
+    @staticmethod
+    def default_reply(prompt: str) -> str:
+        return json.dumps({
+            "intent": "help",
+            "type": "help",
+            "message": "This is a canned reply from the fake LLM client.",
+            "suggestions": ["Search for books", "Check my issued books"]
+        })
+
+    async def generate(self, prompt: str, generation_config: Optional[Dict[str, Any]] = None,
+                       system_instruction: Optional[str] = None) -> LLMResponse:
+        self.calls += 1
+        if self.latency_ms:
+            await asyncio.sleep(self.latency_ms / 1000)
+        text = self.reply(prompt)
+        # Rough 4-characters-per-token estimate, treating the system instruction as cached
+        prefix_tokens = len(system_instruction or "") // 4
+        return self._record(LLMResponse(
+            text=text, prompt_tokens=prefix_tokens + len(prompt) // 4,
+            output_tokens=len(text) // 4, cached_tokens=prefix_tokens
+        ))
+
+
+def create_llm_client(api_key: Optional[str]) -> Optional[LLMClient]:
+    """The configured client, or None when the AI service isn't available"""
+    if LLM_PROVIDER == "fake":
+        return FakeLLMClient()
+    if api_key:
+        return GeminiClient(api_key)
+    return None
@@ -0,0 +1,222 @@
+import os
+import secrets
+import sys
+import threading
+import time
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, List, Optional
+
+from services.lazy_import import lazy_module, module_available
+
+# Optional: without pyinstrument per-request profiling is disabled; the sampling profiler needs nothing
+pyinstrument = lazy_module("pyinstrument")
+PYINSTRUMENT_AVAILABLE = module_available("pyinstrument")
+
+# Requests sending "X-Profile: <token>" are profiled; unset leaves only the admin arm endpoint
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN", "")
+PROFILE_INTERVAL_SECONDS = 0.001
+PROFILES_KEPT = 20
+SAMPLING_PROFILER = os.getenv("SAMPLING_PROFILER", "true").lower() == "true"
+SAMPLING_INTERVAL_MS = float(os.getenv("SAMPLING_INTERVAL_MS", "20"))
+MAX_STACKS = 50000
+MAX_DEPTH = 128
+
+
+@dataclass
+class RequestProfile:
+    id: str
+    method: str
+    path: str
+    started_at: float
+    duration_ms: float = 0
+    status: Optional[int] = None
+    profiler: Any = field(default=None, repr=False)
+
+    def summary(self) -> Dict:
+        return {"id": self.id, "method": self.method, "path": self.path, "status": self.status,
+                "started_at": self.started_at, "duration_ms": round(self.duration_ms, 2)}
+
+
+class RequestProfiler:
+    """Opt-in wall-clock call trees for single requests, recorded with pyinstrument.
+
+    A request is profiled when it carries the profiling token header or matches
+    a path an admin armed for the next few requests. Profiles are kept in a
+    small ring buffer and the response says where to find its profile in
+    X-Profile-Id.
+    """
+
+    def __init__(self, token: str = PROFILING_TOKEN, kept: int = PROFILES_KEPT):
+        self.token = token.encode()
+        self.profiles: Deque[RequestProfile] = deque(maxlen=kept)
+        self._armed: Dict[str, int] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return PYINSTRUMENT_AVAILABLE
+
+    def arm(self, path_prefix: str, count: int):
+        self._armed[path_prefix] = count
+
+    def armed(self) -> Dict[str, int]:
+        return dict(self._armed)
+
+    def should_profile(self, path: str, headers: List) -> bool:
+        if not self.enabled:
+            return False
+        if self.token:
+            for name, value in headers:
+                if name == b"x-profile":
+                    return secrets.compare_digest(value, self.token)
+        for prefix, remaining in self._armed.items():
+            if path.startswith(prefix):
+                if remaining <= 1:
+                    del self._armed[prefix]
+                else:
+                    self._armed[prefix] = remaining - 1
+                return True
+        return False
+
+    def get(self, profile_id: str) -> Optional[RequestProfile]:
+        return next((p for p in self.profiles if p.id == profile_id), None)
+
+
+class ProfilingMiddleware:
+    """ASGI middleware; requests that aren't profiled pass straight through"""
+
+    def __init__(self, app, profiler: "RequestProfiler"):
+        self.app = app
+        self.profiler = profiler
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.profiler.should_profile(scope["path"], scope["headers"]):
+            await self.app(scope, receive, send)
+            return
+
+        profile = RequestProfile(secrets.token_hex(6), scope["method"], scope["path"], time.time())
+        profiler = pyinstrument.Profiler(interval=PROFILE_INTERVAL_SECONDS, async_mode="enabled")
+
+        async def send_with_profile_id(message):
+            if message["type"] == "http.response.start":
+                profile.status = message["status"]
+                message["headers"] = list(message.get("headers", [])) + [(b"x-profile-id", profile.id.encode())]
+            await send(message)
+
+        started = time.perf_counter()
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_with_profile_id)
+        finally:
+            profiler.stop()
+            profile.duration_ms = (time.perf_counter() - started) * 1000
+            profile.profiler = profiler
+            self.profiler.profiles.append(profile)
+            print(f"🧮 Profiled {profile.method} {profile.path} in {profile.duration_ms:.0f}ms (profile {profile.id})")
+
+
+class SamplingProfiler:
+    """Always-on statistical profiler for the event loop thread.
+
+    A daemon thread records the loop thread's Python stack every interval and
+    counts identical stacks, giving folded stacks ("a;b;c count") for
+    flamegraph.pl or speedscope. Samples taken while the loop waits for I/O
+    are counted as idle instead of stored.
+    """
+
+    def __init__(self, interval_ms: float = SAMPLING_INTERVAL_MS):
+        self.interval = interval_ms / 1000
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.idle = 0
+        self.since = time.time()
+        self._labels: Dict[Any, str] = {}
+        self._target: Optional[int] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @staticmethod
+    def _idle(frame) -> bool:
+        # asyncio blocks in selectors' select(); uvloop waits in C under asyncio.run()
+        filename = frame.f_code.co_filename
+        return filename.endswith("selectors.py") or (frame.f_code.co_name == "run" and filename.endswith("runners.py"))
+
+    def _label(self, code) -> str:
+        label = self._labels.get(code)
+        if label is None:
+            label = self._labels[code] = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+        return label
+
+    def _sample(self):
+        frame = sys._current_frames().get(self._target)
+        if frame is None:
+            return
+        if self._idle(frame):
+            with self._lock:
+                self.samples += 1
+                self.idle += 1
+            return
+        labels = []
+        while frame is not None and len(labels) < MAX_DEPTH:
+            labels.append(self._label(frame.f_code))
+            frame = frame.f_back
+        stack = ";".join(reversed(labels))
+        with self._lock:
+            self.samples += 1
+            if stack in self.stacks or len(self.stacks) < MAX_STACKS:
+                self.stacks[stack] += 1
+            else:
+                self.stacks["[other stacks]"] += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self._sample()
+            except Exception as e:
+                print(f"❌ Sampling profiler error: {e}")
+
+    def start(self, thread_id: Optional[int] = None):
+        """Sample the calling thread (the event loop's) unless another is given"""
+        if self._thread:
+            return
+        self._target = thread_id or threading.get_ident()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        print(f"🧮 Sampling profiler running every {self.interval * 1000:.0f}ms")
+
+    def stop(self):
+        self._stop.set()
+        self._thread = None
+
+    def folded(self, reset: bool = False) -> str:
+        with self._lock:
+            stacks = self.stacks.most_common()
+            if reset:
+                self._reset()
+        return "\n".join(f"{stack} {count}" for stack, count in stacks)
+
+    def _reset(self):
+        self.stacks = Counter()
+        self.samples = self.idle = 0
+        self.since = time.time()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            top = self.stacks.most_common(10)
+        busy = self.samples - self.idle
+        return {
+            "running": self._thread is not None,
+            "interval_ms": self.interval * 1000,
+            "since": self.since,
+            "samples": self.samples,
+            "busy_ratio": round(busy / self.samples, 4) if self.samples else 0.0,
+            "distinct_stacks": len(self.stacks),
+            # Innermost frames of the hottest stacks
+            "top": [{"frames": stack.split(";")[-3:], "samples": count} for stack, count in top]
+        }
+
+
+request_profiler = RequestProfiler()
+sampling_profiler = SamplingProfiler()
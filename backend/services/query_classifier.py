@@ -0,0 +1,82 @@
+import os
+import re
+from bisect import bisect_right
+from functools import lru_cache
+from typing import Iterable, List, Optional
+
+DEFAULT_TECHNICAL_KEYWORDS = [
+    'programming', 'coding', 'software', 'python', 'javascript', 'java',
+    'react', 'node', 'algorithm', 'data structure', 'machine learning',
+    'ai', 'artificial intelligence', 'web development', 'backend',
+    'frontend', 'database', 'sql', 'nosql', 'devops', 'cloud'
+]
+
+# Extra keywords: comma separated in TECHNICAL_KEYWORDS, or one per line in TECHNICAL_KEYWORDS_FILE
+TECHNICAL_KEYWORDS = os.getenv("TECHNICAL_KEYWORDS", "")
+TECHNICAL_KEYWORDS_FILE = os.getenv("TECHNICAL_KEYWORDS_FILE", "")
+CLASSIFIER_CACHE_SIZE = int(os.getenv("CLASSIFIER_CACHE_SIZE", "4096"))
+
+_WHITESPACE = re.compile(r"\s+")
+
+
+def load_keywords() -> List[str]:
+    """Default technical keywords plus any configured extras"""
+    keywords = list(DEFAULT_TECHNICAL_KEYWORDS)
+    keywords.extend(k for k in TECHNICAL_KEYWORDS.split(",") if k.strip())
+
+    if TECHNICAL_KEYWORDS_FILE:
+        try:
+            with open(TECHNICAL_KEYWORDS_FILE, encoding="utf-8") as f:
+                keywords.extend(line for line in f if line.strip() and not line.startswith("#"))
+        except OSError as e:
+            print(f"⚠️ Could not load technical keywords from {TECHNICAL_KEYWORDS_FILE}: {e}")
+
+    return keywords
+
+
+class QueryClassifier:
+    """Whole-word keyword classifier for routing technical queries"""
+
+    def __init__(self, keywords: Optional[Iterable[str]] = None, cache_size: int = CLASSIFIER_CACHE_SIZE):
+        self.keywords = sorted({self.normalize(k) for k in (keywords or load_keywords()) if k.strip()})
+        # Longest first so "java" never shadows "javascript"; a trailing "s" covers plurals
+        alternation = "|".join(re.escape(k) for k in sorted(self.keywords, key=len, reverse=True))
+        self.pattern = re.compile(rf"\b(?:{alternation})s?\b")
+        self._classify = lru_cache(maxsize=cache_size)(self._classify_normalized)
+
+    @staticmethod
+    def normalize(query: str) -> str:
+        return _WHITESPACE.sub(" ", query.lower()).strip()
+
+    def _classify_normalized(self, normalized: str) -> bool:
+        return self.pattern.search(normalized) is not None
+
+    def is_technical(self, query: str) -> bool:
+        return self._classify(self.normalize(query))
+
+    def classify_many(self, queries: Iterable[str]) -> List[bool]:
+        """Classify a batch of queries with a single regex pass over all of them"""
+        normalized = [self.normalize(q) for q in queries]
+        unique = list(dict.fromkeys(normalized))
+        if not unique:
+            return []
+
+        # Newlines never survive normalize(), so they are safe separators for one combined scan
+        offsets = []
+        position = 0
+        for query in unique:
+            offsets.append(position)
+            position += len(query) + 1
+
+        hits = set()
+        for match in self.pattern.finditer("\n".join(unique)):
+            hits.add(bisect_right(offsets, match.start()) - 1)
+
+        technical = {query: i in hits for i, query in enumerate(unique)}
+        return [technical[query] for query in normalized]
+
+    def cache_info(self):
+        return self._classify.cache_info()
+
+
+query_classifier = QueryClassifier()
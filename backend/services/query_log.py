@@ -0,0 +1,121 @@
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+import asyncpg
+
+# Distinct queries tracked; the rarest is replaced when a new one arrives
+QUERY_LOG_CAPACITY = int(os.getenv("QUERY_LOG_CAPACITY", "1000"))
+# Counts halve over this long, so yesterday's spike gives way to today's searches
+QUERY_LOG_HALF_LIFE_HOURS = float(os.getenv("QUERY_LOG_HALF_LIFE_HOURS", "24"))
+# Rows not saved by any instance for this long are dropped from the table
+QUERY_LOG_STALE_DAYS = 7
+MAX_QUERY_LENGTH = 120
+
+
+def query_key(query: str) -> str:
+    """Lowercased with whitespace collapsed, the same folding the query classifier uses.
+
+    Punctuation is kept: 'c++' and 'c#' are different searches upstream.
+    """
+    return " ".join(query.lower().split())[:MAX_QUERY_LENGTH]
+
+
+class QueryLog:
+    """Popular searches in bounded memory, tracked with the Space-Saving algorithm.
+
+    At most `capacity` queries are counted. A query that isn't tracked takes the
+    slot of the current minimum and inherits its count plus one, so any query
+    searched more than total/capacity times is guaranteed to be in the log and
+    its count is overestimated by at most the inherited `error`. Counts decay
+    exponentially and the top of the log is saved to the database, so a fresh
+    deploy starts with the searches the previous one saw.
+    """
+
+    def __init__(self, capacity: int = QUERY_LOG_CAPACITY, half_life_hours: float = QUERY_LOG_HALF_LIFE_HOURS):
+        self.capacity = capacity
+        self.half_life = half_life_hours * 3600
+        self.counts: Dict[str, float] = {}
+        self.errors: Dict[str, float] = {}
+        # Most recent spelling of each query, for display in typeahead
+        self.display: Dict[str, str] = {}
+        self._decayed_at = time.monotonic()
+
+    def record(self, query: str, weight: float = 1):
+        key = query_key(query)
+        if len(key) < 2:
+            return
+        self.display[key] = " ".join(query.split())[:MAX_QUERY_LENGTH]
+        if key in self.counts:
+            self.counts[key] += weight
+            return
+        if len(self.counts) < self.capacity:
+            self.counts[key] = weight
+            self.errors[key] = 0
+            return
+        evicted = min(self.counts, key=self.counts.get)
+        floor = self.counts.pop(evicted)
+        del self.errors[evicted], self.display[evicted]
+        self.counts[key] = floor + weight
+        self.errors[key] = floor
+
+    def decay(self, now: Optional[float] = None):
+        """Scale every count down by the time elapsed since the last decay"""
+        now = time.monotonic() if now is None else now
+        factor = 0.5 ** ((now - self._decayed_at) / self.half_life)
+        self._decayed_at = now
+        for key in self.counts:
+            self.counts[key] *= factor
+            self.errors[key] *= factor
+
+    def top(self, n: int) -> List[Tuple[str, float]]:
+        """(key, count) of the n most searched queries, most popular first"""
+        return sorted(self.counts.items(), key=lambda item: item[1], reverse=True)[:n]
+
+    def popular(self, n: int, min_count: float = 0) -> Dict[str, float]:
+        """Display text -> count for the top n queries with at least min_count guaranteed searches"""
+        return {
+            self.display[key]: count for key, count in self.top(n)
+            if count - self.errors[key] >= min_count
+        }
+
+    async def init_table(self, db: asyncpg.Connection):
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS search_query_log (
+                query_key VARCHAR(120) PRIMARY KEY,
+                query VARCHAR(120) NOT NULL,
+                count DOUBLE PRECISION NOT NULL,
+                saved_at TIMESTAMP NOT NULL DEFAULT timezone('utc', now())
+            )
+        """)
+
+    async def save(self, db: asyncpg.Connection):
+        # Error is subtracted so repeated save/load cycles don't inflate counts
+        entries = [(key, count - self.errors[key]) for key, count in self.top(self.capacity)]
+        entries = [(key, count) for key, count in entries if count > 0]
+        async with db.transaction():
+            await db.execute("""
+                INSERT INTO search_query_log (query_key, query, count)
+                SELECT * FROM unnest($1::VARCHAR[], $2::VARCHAR[], $3::DOUBLE PRECISION[])
+                ON CONFLICT (query_key) DO UPDATE
+                SET query = EXCLUDED.query, count = EXCLUDED.count, saved_at = timezone('utc', now())
+            """, [key for key, _ in entries], [self.display[key] for key, _ in entries], [count for _, count in entries])
+            await db.execute(
+                "DELETE FROM search_query_log WHERE saved_at < timezone('utc', now()) - make_interval(days => $1)",
+                QUERY_LOG_STALE_DAYS
+            )
+
+    async def load(self, db: asyncpg.Connection) -> int:
+        """Seed the log with saved counts; queries already recorded since startup keep their own"""
+        rows = await db.fetch(
+            "SELECT query, count FROM search_query_log ORDER BY count DESC LIMIT $1", self.capacity
+        )
+        loaded = 0
+        for row in reversed(rows):
+            if query_key(row['query']) not in self.counts:
+                self.record(row['query'], row['count'])
+                loaded += 1
+        return loaded
+
+
+query_log = QueryLog()
@@ -0,0 +1,123 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Dict, Tuple
+
+# Per-client token buckets: a burst allowance refilled at the per-minute rate
+RATE_LIMITS: Dict[str, Tuple[float, float]] = {
+    "chat": (
+        float(os.getenv("RATE_LIMIT_CHAT_BURST", "5")),
+        float(os.getenv("RATE_LIMIT_CHAT_PER_MINUTE", "20")),
+    ),
+    "search": (
+        float(os.getenv("RATE_LIMIT_SEARCH_BURST", "10")),
+        float(os.getenv("RATE_LIMIT_SEARCH_PER_MINUTE", "60")),
+    ),
+}
+RATE_LIMIT_MAX_CLIENTS = 10000
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "16"))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "10"))
+UPSTREAM_SEARCH_MAX_CONCURRENCY = int(os.getenv("UPSTREAM_SEARCH_MAX_CONCURRENCY", "8"))
+UPSTREAM_SEARCH_MAX_QUEUE = int(os.getenv("UPSTREAM_SEARCH_MAX_QUEUE", "32"))
+
+
+class Overloaded(Exception):
+    """Raised instead of queueing work the service can't get to in time"""
+
+    def __init__(self, name: str, retry_after: float = 1.0):
+        super().__init__(f"{name} is overloaded")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    __slots__ = ("capacity", "rate", "tokens", "updated")
+
+    def __init__(self, capacity: float, per_minute: float, now: float):
+        self.capacity = capacity
+        self.rate = per_minute / 60
+        self.tokens = capacity
+        self.updated = now
+
+    def take(self, now: float) -> float:
+        """Spend a token; returns 0 on success, else seconds until one is available"""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate if self.rate > 0 else 60.0
+
+
+class RateLimiter:
+    """Token buckets keyed by (route, client), evicting the least recently seen clients"""
+
+    def __init__(self, limits: Dict[str, Tuple[float, float]] = RATE_LIMITS, max_clients: int = RATE_LIMIT_MAX_CLIENTS):
+        self.limits = limits
+        self.max_clients = max_clients
+        self._buckets: "OrderedDict[Tuple[str, str], TokenBucket]" = OrderedDict()
+
+    def check(self, route: str, client: str) -> float:
+        """0 if the request may proceed, else the Retry-After in seconds"""
+        now = time.monotonic()
+        key = (route, client)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            burst, per_minute = self.limits[route]
+            bucket = self._buckets[key] = TokenBucket(burst, per_minute, now)
+            if len(self._buckets) > self.max_clients:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(key)
+        return bucket.take(now)
+
+
+class Bulkhead:
+    """Caps concurrent calls to a dependency and sheds load once too many are waiting.
+
+    Callers beyond max_concurrent wait for a slot, but only up to max_waiting of
+    them and for at most wait_timeout seconds; everyone else gets Overloaded
+    straight away instead of piling up coroutines.
+    """
+
+    def __init__(self, name: str, max_concurrent: int, max_waiting: int, wait_timeout: float = 10.0):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_waiting = max_waiting
+        self.wait_timeout = wait_timeout
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._waiting = 0
+        self._in_use = 0
+
+    @asynccontextmanager
+    async def slot(self):
+        if self._semaphore.locked():
+            if self._waiting >= self.max_waiting:
+                raise Overloaded(self.name)
+            self._waiting += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=self.wait_timeout)
+            except asyncio.TimeoutError:
+                raise Overloaded(self.name)
+            finally:
+                self._waiting -= 1
+        else:
+            await self._semaphore.acquire()
+        self._in_use += 1
+        try:
+            yield
+        finally:
+            self._in_use -= 1
+            self._semaphore.release()
+
+    def stats(self) -> Dict[str, int]:
+        return {"in_use": self._in_use, "waiting": self._waiting}
+
+
+rate_limiter = RateLimiter()
+llm_bulkhead = Bulkhead("llm", LLM_MAX_CONCURRENCY, LLM_MAX_QUEUE, LLM_QUEUE_TIMEOUT)
+upstream_search_bulkhead = Bulkhead("book search", UPSTREAM_SEARCH_MAX_CONCURRENCY, UPSTREAM_SEARCH_MAX_QUEUE)
@@ -0,0 +1,193 @@
+import asyncio
+import os
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import asyncpg
+
+from services.lazy_import import lazy_module
+
+np = lazy_module("numpy")
+sparse = lazy_module("scipy.sparse")
+
+RECOMMENDATION_TOP_K = int(os.getenv("RECOMMENDATION_TOP_K", "20"))
+RECOMMENDATION_REFRESH_MINUTES = int(os.getenv("RECOMMENDATION_REFRESH_MINUTES", "10"))
+SIMILARITY_BATCH_SIZE = 512
+
+
+def compute_neighbours(pairs: Iterable[Tuple[int, str]], top_k: int,
+                       target_books: Optional[Iterable[str]] = None,
+                       borrower_counts: Optional[Dict[str, int]] = None) -> List[Tuple[str, str, float]]:
+    """Top-k co-borrowing neighbours as (book_id, neighbour_id, cosine score) rows.
+
+    pairs are distinct (user_id, book_id) borrow events. Similarity is the cosine of
+    the books' binary borrower vectors: co_borrowers / sqrt(borrowers_a * borrowers_b).
+    When pairs only cover the target books' borrowers, borrower_counts supplies
+    each book's total borrowers, which the pairs alone would undercount.
+    """
+    users: Dict[int, int] = {}
+    books: Dict[str, int] = {}
+    rows, cols = [], []
+    for user_id, book_id in pairs:
+        rows.append(users.setdefault(user_id, len(users)))
+        cols.append(books.setdefault(book_id, len(books)))
+    if not books:
+        return []
+
+    matrix = sparse.csc_matrix(
+        (np.ones(len(rows), dtype=np.float32), (rows, cols)),
+        shape=(len(users), len(books))
+    )
+    matrix.data[:] = 1  # Binary even if a pair slipped in twice
+    borrowers = np.asarray(matrix.sum(axis=0)).ravel()
+    book_ids = list(books)
+    if borrower_counts is not None:
+        totals = np.array([borrower_counts.get(book_id, 0) for book_id in book_ids], dtype=borrowers.dtype)
+        borrowers = np.maximum(borrowers, totals)
+
+    if target_books is None:
+        targets = np.arange(len(books))
+    else:
+        targets = np.array([books[b] for b in set(target_books) if b in books], dtype=np.int64)
+
+    result = []
+    # Batches keep the dense-ish co-occurrence block bounded for very popular titles
+    for start in range(0, len(targets), SIMILARITY_BATCH_SIZE):
+        batch = targets[start:start + SIMILARITY_BATCH_SIZE]
+        co_borrows = (matrix[:, batch].T @ matrix).tocsr()
+        for row, book_index in enumerate(batch):
+            begin, end = co_borrows.indptr[row], co_borrows.indptr[row + 1]
+            neighbours = co_borrows.indices[begin:end]
+            counts = co_borrows.data[begin:end]
+            keep = neighbours != book_index
+            neighbours, counts = neighbours[keep], counts[keep]
+            if neighbours.size == 0:
+                continue
+
+            scores = counts / np.sqrt(borrowers[book_index] * borrowers[neighbours])
+            if scores.size > top_k:
+                top = np.argpartition(-scores, top_k)[:top_k]
+            else:
+                top = np.arange(scores.size)
+            top = top[np.argsort(-scores[top], kind="stable")]
+
+            source = book_ids[book_index]
+            result.extend((source, book_ids[neighbours[i]], float(scores[i])) for i in top)
+    return result
+
+
+class RecommendationService:
+    """Item-item co-borrowing recommendations precomputed into book_neighbours"""
+
+    def __init__(self, top_k: int = RECOMMENDATION_TOP_K):
+        self.top_k = top_k
+
+    async def init_tables(self, db: asyncpg.Connection):
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS book_neighbours (
+                book_id VARCHAR(255) NOT NULL,
+                neighbour_id VARCHAR(255) NOT NULL,
+                score REAL NOT NULL,
+                PRIMARY KEY (book_id, neighbour_id)
+            )
+        """)
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS recommendation_state (
+                id INTEGER PRIMARY KEY DEFAULT 1 CHECK (id = 1),
+                last_loan_id INTEGER NOT NULL DEFAULT 0,
+                refreshed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        await db.execute("INSERT INTO recommendation_state (id) VALUES (1) ON CONFLICT (id) DO NOTHING")
+
+    async def refresh(self, db: asyncpg.Connection, full: bool = False) -> int:
+        """Recompute neighbours for books touched by loans since the last run (or all books)
+
+        A new loan changes the rows of every book its borrower has read, so those
+        are the rows recomputed, from the loans of those books' borrowers only
+        plus each neighbour's total borrower count. Scores of other rows drift
+        slightly as borrower counts grow; the nightly full rebuild corrects them.
+        """
+        last_loan_id = await db.fetchval("SELECT last_loan_id FROM recommendation_state WHERE id = 1")
+        max_loan_id = await db.fetchval("SELECT COALESCE(MAX(id), 0) FROM issued_books")
+        if not full and max_loan_id <= last_loan_id:
+            return 0
+
+        target_books = None
+        borrower_counts = None
+        if full:
+            pairs = [(row['user_id'], row['book_id']) for row in await db.fetch("""
+                SELECT DISTINCT user_id, book_id FROM loan_history WHERE id <= $1
+            """, max_loan_id)]
+        else:
+            target_books = [row['book_id'] for row in await db.fetch("""
+                SELECT DISTINCT book_id FROM loan_history
+                WHERE user_id IN (SELECT user_id FROM issued_books WHERE id > $1 AND id <= $2)
+            """, last_loan_id, max_loan_id)]
+            # Anyone who co-borrowed a target book borrowed the target too, so its borrowers' loans suffice
+            pairs = [(row['user_id'], row['book_id']) for row in await db.fetch("""
+                SELECT DISTINCT user_id, book_id FROM loan_history
+                WHERE id <= $2 AND user_id IN (
+                    SELECT user_id FROM loan_history WHERE book_id = ANY($1::VARCHAR[]) AND id <= $2
+                )
+            """, target_books, max_loan_id)]
+            borrower_counts = {row['book_id']: row['borrowers'] for row in await db.fetch("""
+                SELECT book_id, COUNT(DISTINCT user_id) AS borrowers FROM loan_history
+                WHERE id <= $2 AND book_id = ANY($1::VARCHAR[])
+                GROUP BY book_id
+            """, list({book_id for _, book_id in pairs}), max_loan_id)}
+        neighbours = await asyncio.to_thread(compute_neighbours, pairs, self.top_k, target_books, borrower_counts)
+
+        async with db.transaction():
+            if full:
+                await db.execute("DELETE FROM book_neighbours")
+            else:
+                await db.execute("DELETE FROM book_neighbours WHERE book_id = ANY($1::VARCHAR[])", target_books)
+            if neighbours:
+                await db.copy_records_to_table(
+                    "book_neighbours", records=neighbours, columns=["book_id", "neighbour_id", "score"]
+                )
+            await db.execute("""
+                UPDATE recommendation_state SET last_loan_id = $1, refreshed_at = CURRENT_TIMESTAMP
+                WHERE id = 1
+            """, max_loan_id)
+
+        refreshed = len(target_books) if target_books is not None else len({n[0] for n in neighbours})
+        print(f"✅ Recommendations refreshed for {refreshed} books")
+        return refreshed
+
+    async def for_user(self, db: asyncpg.Connection, user_id: int, limit: int = 10) -> List[asyncpg.Record]:
+        """Neighbours of the user's recent loans, scored by mean similarity, excluding books they've read"""
+        seeds = [row['book_id'] for row in await db.fetch("""
+            SELECT book_id FROM loan_history
+            WHERE user_id = $1
+            GROUP BY book_id
+            ORDER BY MAX(issue_date) DESC
+            LIMIT 20
+        """, user_id)]
+        if not seeds:
+            return []
+
+        read = [row['book_id'] for row in await db.fetch(
+            "SELECT DISTINCT book_id FROM loan_history WHERE user_id = $1", user_id
+        )]
+        return await db.fetch("""
+            WITH scored AS (
+                SELECT n.neighbour_id,
+                       SUM(n.score) / $3 AS confidence,
+                       (array_agg(n.book_id ORDER BY n.score DESC))[1] AS because_of
+                FROM book_neighbours n
+                WHERE n.book_id = ANY($1::VARCHAR[]) AND NOT (n.neighbour_id = ANY($2::VARCHAR[]))
+                GROUP BY n.neighbour_id
+                ORDER BY confidence DESC
+                LIMIT $4
+            )
+            SELECT s.neighbour_id AS book_id, i.title, i.author, i.available_copies, i.total_copies,
+                   s.confidence, b.title AS because_of_title
+            FROM scored s
+            JOIN book_inventory i ON i.book_id = s.neighbour_id
+            LEFT JOIN book_inventory b ON b.book_id = s.because_of
+            ORDER BY s.confidence DESC
+        """, seeds, read, len(seeds), limit)
+
+
+recommendation_service = RecommendationService()
@@ -0,0 +1,149 @@
+import asyncio
+import itertools
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import asyncpg
+
+# Comma-separated standby URLs; empty keeps every query on DATABASE_URL
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+# A replica further behind than this is skipped until it catches up
+REPLICA_MAX_LAG_SECONDS = float(os.getenv("REPLICA_MAX_LAG_SECONDS", "5"))
+REPLICA_LAG_CHECK_SECONDS = int(os.getenv("REPLICA_LAG_CHECK_SECONDS", "5"))
+# How long a member's reads stay on the primary after they change something
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "10"))
+REPLICA_POOL_MAX_SIZE = int(os.getenv("REPLICA_POOL_MAX_SIZE", "10"))
+
+# Seconds the standby is behind the primary; 0 when it has replayed everything it received
+# while still streaming, so an idle primary doesn't look like a lagging replica
+LAG_QUERY = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn()
+             AND EXISTS (SELECT 1 FROM pg_stat_wal_receiver WHERE status = 'streaming') THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END::float8
+"""
+
+
+class Replica:
+    def __init__(self, url: str):
+        self.url = url
+        self.pool: Optional[asyncpg.Pool] = None
+        # None until the first lag check succeeds; unknown lag means not routable
+        self.lag_seconds: Optional[float] = None
+
+    @property
+    def host(self) -> str:
+        return self.url.rpartition("@")[2].split("/")[0]
+
+    async def get_pool(self) -> asyncpg.Pool:
+        if self.pool is None:
+            self.pool = await asyncpg.create_pool(self.url, min_size=1, max_size=REPLICA_POOL_MAX_SIZE)
+        return self.pool
+
+
+class ReplicaRouter:
+    """Sends read-only queries to streaming replicas that are close enough to the primary.
+
+    Members who just issued, returned or otherwise changed something are pinned to
+    the primary for READ_YOUR_WRITES_SECONDS so they never see their own change undone.
+    Anything that can't be served by a healthy replica returns None and the caller
+    uses the primary.
+    """
+
+    def __init__(self, urls: List[str], max_lag_seconds: float = REPLICA_MAX_LAG_SECONDS,
+                 read_your_writes_seconds: float = READ_YOUR_WRITES_SECONDS):
+        self.replicas = [Replica(url) for url in urls]
+        self.max_lag_seconds = max_lag_seconds
+        # A usable replica is at most max_lag behind, so pinning for less than that isn't enough
+        self.pin_seconds = max(read_your_writes_seconds, max_lag_seconds)
+        self._last_write: "OrderedDict[int, float]" = OrderedDict()
+        self._next = itertools.count()
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.replicas)
+
+    def note_write(self, user_id: Optional[int]):
+        if not self.enabled or user_id is None:
+            return
+        now = time.monotonic()
+        self._last_write[user_id] = now
+        self._last_write.move_to_end(user_id)
+        # Oldest writes are at the front; drop pins that have run out
+        while self._last_write:
+            oldest_user, written_at = next(iter(self._last_write.items()))
+            if now - written_at < self.pin_seconds:
+                break
+            del self._last_write[oldest_user]
+
+    def pinned(self, user_id: Optional[int]) -> bool:
+        written_at = self._last_write.get(user_id) if user_id is not None else None
+        return written_at is not None and time.monotonic() - written_at < self.pin_seconds
+
+    def _healthy(self) -> List[Replica]:
+        return [r for r in self.replicas if r.lag_seconds is not None and r.lag_seconds <= self.max_lag_seconds]
+
+    def _pick(self) -> Optional[Replica]:
+        healthy = self._healthy()
+        return healthy[next(self._next) % len(healthy)] if healthy else None
+
+    async def acquire(self, user_id: Optional[int] = None) -> Optional[Tuple[asyncpg.Pool, asyncpg.Connection]]:
+        """A pooled replica connection for this read, or None when it should go to the primary.
+        
+        The caller releases the connection back to the returned pool.
+        """
+        if not self.enabled or self.pinned(user_id):
+            return None
+        replica = self._pick()
+        if replica is None:
+            return None
+        try:
+            pool = await replica.get_pool()
+            return pool, await pool.acquire()
+        except Exception as e:
+            print(f"⚠️ Replica {replica.host} unreachable, reading from primary: {e}")
+            replica.lag_seconds = None
+            return None
+
+    def dedicated_url(self) -> Optional[str]:
+        """URL of a healthy replica for a long read that opens its own connection"""
+        replica = self._pick()
+        return replica.url if replica else None
+
+    async def check_lag(self):
+        async def check(replica: Replica):
+            try:
+                pool = await replica.get_pool()
+                lag = await pool.fetchval(LAG_QUERY)
+            except Exception as e:
+                if replica.lag_seconds is not None:
+                    print(f"❌ Replica {replica.host} lag check failed: {e}")
+                replica.lag_seconds = None
+                return
+            if lag is not None and lag > self.max_lag_seconds >= (replica.lag_seconds or 0):
+                print(f"⚠️ Replica {replica.host} is {lag:.1f}s behind, reading from primary until it catches up")
+            replica.lag_seconds = lag
+        await asyncio.gather(*(check(replica) for replica in self.replicas))
+
+    def stats(self) -> Dict:
+        return {
+            "replicas": [
+                {"host": r.host, "lag_seconds": None if r.lag_seconds is None else round(r.lag_seconds, 3)}
+                for r in self.replicas
+            ],
+            "healthy": len(self._healthy()),
+            "pinned_users": sum(1 for user_id in self._last_write if self.pinned(user_id))
+        }
+
+    async def close(self):
+        for replica in self.replicas:
+            if replica.pool is not None:
+                await replica.pool.close()
+                replica.pool = None
+
+
+replica_router = ReplicaRouter(DATABASE_REPLICA_URLS)
@@ -0,0 +1,186 @@
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import asyncpg
+
+from services.inventory import InventoryService
+
+ACTIVE_STATUSES = "('waiting', 'ready')"
+
+
+class ReservationService:
+    """Per-book FIFO reservation queues.
+
+    Every reservation gets a monotonically increasing queue_seq from its book's
+    reservation_queues row. A queue position is the number of active
+    reservations ahead of it, counted on the (book_id, queue_seq) partial index,
+    so it is always read from committed state. That count is O(members ahead)
+    rather than a constant-time rank: members leave from the middle (cancellations)
+    as well as the head, so a head watermark alone can't give the position, and
+    queues are short enough that an index range count beats maintaining ranks on
+    every departure.
+    """
+
+    def __init__(self, hold_days: int, max_per_user: int, inventory: InventoryService):
+        self.hold_days = hold_days
+        self.max_per_user = max_per_user
+        self.inventory = inventory
+
+    async def init_tables(self, db: asyncpg.Connection):
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS reservation_queues (
+                book_id VARCHAR(255) PRIMARY KEY,
+                next_seq BIGINT NOT NULL DEFAULT 0
+            )
+        """)
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS reservations (
+                id SERIAL PRIMARY KEY,
+                user_id INTEGER REFERENCES users(id) ON DELETE CASCADE,
+                book_id VARCHAR(255) NOT NULL,
+                book_title VARCHAR(500) NOT NULL,
+                queue_seq BIGINT NOT NULL,
+                status VARCHAR(20) NOT NULL DEFAULT 'waiting',
+                reservation_date DATE NOT NULL DEFAULT CURRENT_DATE,
+                expiry_date DATE,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        await db.execute(f"""
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_reservations_active_user_book
+            ON reservations (user_id, book_id) WHERE status IN {ACTIVE_STATUSES}
+        """)
+        await db.execute(f"""
+            CREATE INDEX IF NOT EXISTS idx_reservations_queue
+            ON reservations (book_id, queue_seq) WHERE status IN {ACTIVE_STATUSES}
+        """)
+        await db.execute("""
+            CREATE INDEX IF NOT EXISTS idx_reservations_ready_expiry
+            ON reservations (expiry_date) WHERE status = 'ready'
+        """)
+
+    async def position(self, db: asyncpg.Connection, book_id: str, queue_seq: int) -> int:
+        ahead = await db.fetchval(f"""
+            SELECT COUNT(*) FROM reservations
+            WHERE book_id = $1 AND queue_seq < $2 AND status IN {ACTIVE_STATUSES}
+        """, book_id, queue_seq)
+        return ahead + 1
+
+    async def reserve(self, db: asyncpg.Connection, user_id: int, book_id: str, book_title: str) -> asyncpg.Record:
+        """Append the user to the book's queue; caller runs this inside a transaction"""
+        # The upsert row-locks the queue, so concurrent reservations for a book get distinct seqs
+        queue = await db.fetchrow("""
+            INSERT INTO reservation_queues (book_id, next_seq) VALUES ($1, 1)
+            ON CONFLICT (book_id) DO UPDATE SET next_seq = reservation_queues.next_seq + 1
+            RETURNING next_seq
+        """, book_id)
+        reservation = await db.fetchrow("""
+            INSERT INTO reservations (user_id, book_id, book_title, queue_seq)
+            VALUES ($1, $2, $3, $4)
+            RETURNING *
+        """, user_id, book_id, book_title, queue['next_seq'])
+        return reservation
+
+    async def active_count(self, db: asyncpg.Connection, user_id: int) -> int:
+        return await db.fetchval(f"""
+            SELECT COUNT(*) FROM reservations
+            WHERE user_id = $1 AND status IN {ACTIVE_STATUSES}
+        """, user_id)
+
+    async def get_active(self, db: asyncpg.Connection, user_id: int, book_id: str) -> Optional[asyncpg.Record]:
+        return await db.fetchrow(f"""
+            SELECT * FROM reservations
+            WHERE user_id = $1 AND book_id = $2 AND status IN {ACTIVE_STATUSES}
+        """, user_id, book_id)
+
+    async def _close(self, db: asyncpg.Connection, reservation_id: int, status: str) -> Optional[asyncpg.Record]:
+        return await db.fetchrow(f"""
+            UPDATE reservations SET status = $2, updated_at = CURRENT_TIMESTAMP
+            WHERE id = $1 AND status IN {ACTIVE_STATUSES}
+            RETURNING *
+        """, reservation_id, status)
+
+    async def cancel(self, db: asyncpg.Connection, user_id: int,
+                     reservation_id: int) -> Tuple[Optional[asyncpg.Record], Optional[asyncpg.Record]]:
+        """Cancel a reservation; a cancelled hold passes the copy to the next member"""
+        current = await db.fetchrow("SELECT user_id, status FROM reservations WHERE id = $1", reservation_id)
+        if not current or current['user_id'] != user_id:
+            return None, None
+
+        cancelled = await self._close(db, reservation_id, 'cancelled')
+        promoted = None
+        if cancelled and current['status'] == 'ready':
+            promoted = await self._pass_on_hold(db, cancelled['book_id'])
+        return cancelled, promoted
+
+    async def fulfill(self, db: asyncpg.Connection, user_id: int, book_id: str):
+        """Mark the user's reservation as fulfilled once they issue the book"""
+        reservation = await self.get_active(db, user_id, book_id)
+        if reservation:
+            await self._close(db, reservation['id'], 'fulfilled')
+
+    async def promote_next(self, db: asyncpg.Connection, book_id: str) -> Optional[asyncpg.Record]:
+        """Hold a freed copy for the head of the queue; caller runs this in the return transaction"""
+        return await db.fetchrow("""
+            UPDATE reservations SET status = 'ready', expiry_date = $2, updated_at = CURRENT_TIMESTAMP
+            WHERE id = (
+                SELECT id FROM reservations
+                WHERE book_id = $1 AND status = 'waiting'
+                ORDER BY queue_seq
+                LIMIT 1
+                -- Plain FOR UPDATE: skipping a locked head would promote the second member out of turn
+                FOR UPDATE
+            )
+            RETURNING *
+        """, book_id, date.today() + timedelta(days=self.hold_days))
+
+    async def promote_to_shelf(self, db: asyncpg.Connection, book_id: str) -> List[asyncpg.Record]:
+        """Hold shelf copies for waiting members, e.g. after an admin adds copies; caller runs this in a transaction"""
+        promoted = []
+        while True:
+            copy_id = await self.inventory.checkout_copy(db, book_id, to_status='on_hold')
+            if copy_id is None:
+                break
+            reservation = await self.promote_next(db, book_id)
+            if reservation is None:
+                # Nobody is waiting: the copy goes back on the shelf
+                await self.inventory.release_held_copy(db, book_id)
+                break
+            promoted.append(reservation)
+        return promoted
+
+    async def _pass_on_hold(self, db: asyncpg.Connection, book_id: str) -> Optional[asyncpg.Record]:
+        """Give a lapsed hold's copy to the next member, or put it back on the shelf"""
+        promoted = await self.promote_next(db, book_id)
+        if not promoted:
+            await self.inventory.release_held_copy(db, book_id)
+        return promoted
+
+    async def expire_holds(self, db: asyncpg.Connection) -> List[Tuple[asyncpg.Record, Optional[asyncpg.Record]]]:
+        """Expire uncollected holds and pass each copy on; returns (expired, promoted) pairs"""
+        results = []
+        expired_ids = await db.fetch("""
+            SELECT id FROM reservations
+            WHERE status = 'ready' AND expiry_date < $1
+            ORDER BY expiry_date
+        """, date.today())
+        for row in expired_ids:
+            async with db.transaction():
+                expired = await self._close(db, row['id'], 'expired')
+                if expired:
+                    results.append((expired, await self._pass_on_hold(db, expired['book_id'])))
+        return results
+
+    async def list_for_user(self, db: asyncpg.Connection, user_id: int) -> List[Dict]:
+        rows = await db.fetch(f"""
+            SELECT r.*, (
+                SELECT COUNT(*) FROM reservations ahead
+                WHERE ahead.book_id = r.book_id AND ahead.queue_seq < r.queue_seq
+                  AND ahead.status IN {ACTIVE_STATUSES}
+            ) + 1 AS position_in_queue
+            FROM reservations r
+            WHERE r.user_id = $1 AND r.status IN {ACTIVE_STATUSES}
+            ORDER BY r.created_at
+        """, user_id)
+        return [dict(row) for row in rows]
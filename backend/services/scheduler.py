@@ -0,0 +1,4 @@
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+
+# Shared in-process scheduler for periodic maintenance jobs; started and stopped in main.lifespan
+scheduler = AsyncIOScheduler()
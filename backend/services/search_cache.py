@@ -0,0 +1,115 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, Iterable, List, Tuple
+
+from services.query_log import query_key
+from services.rate_limit import Overloaded
+
+SEARCH_CACHE_TTL_SECONDS = int(os.getenv("SEARCH_CACHE_TTL_SECONDS", "1800"))
+# An empty result may just be an upstream that timed out, so it is retried sooner
+SEARCH_CACHE_EMPTY_TTL_SECONDS = 60
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "2000"))
+SEARCH_WARM_MINUTES = int(os.getenv("SEARCH_WARM_MINUTES", "5"))
+SEARCH_WARM_TOP = int(os.getenv("SEARCH_WARM_TOP", "50"))
+# Refetches in flight at once while warming, leaving the rest of the upstream bulkhead to members
+SEARCH_WARM_CONCURRENCY = 2
+
+Fetch = Callable[[str, int], Awaitable[List[Dict]]]
+
+
+@dataclass
+class CachedSearch:
+    results: List[Dict]
+    fetched_at: float
+    expires_at: float
+
+
+class SearchCache:
+    """TTL cache of upstream search results keyed by (query_key, limit).
+
+    Concurrent misses for the same key share one upstream fetch. warm() refetches
+    popular queries at the default limits whose entries are missing or expire
+    within the next two warm intervals, so a popular search is always answered
+    from memory. Other limits are cached on demand but never warmed.
+    """
+
+    def __init__(self, ttl: float = SEARCH_CACHE_TTL_SECONDS, max_entries: int = SEARCH_CACHE_MAX_ENTRIES,
+                 refresh_ahead: float = SEARCH_WARM_MINUTES * 60 * 2):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.refresh_ahead = refresh_ahead
+        self._entries: "OrderedDict[Tuple[str, int], CachedSearch]" = OrderedDict()
+        self._inflight: Dict[Tuple[str, int], asyncio.Task] = {}
+        self.counters = {"hits": 0, "misses": 0, "warmed": 0}
+
+    async def get(self, query: str, limit: int, fetch: Fetch) -> List[Dict]:
+        """Cached results for a search, fetching them with fetch(query_key, limit) on a miss"""
+        key = (query_key(query), limit)
+        entry = self._entries.get(key)
+        if entry and entry.expires_at > time.monotonic():
+            self._entries.move_to_end(key)
+            self.counters["hits"] += 1
+            return entry.results
+        self.counters["misses"] += 1
+        return await self._fetch(key, fetch)
+
+    async def _fetch(self, key: Tuple[str, int], fetch: Fetch) -> List[Dict]:
+        task = self._inflight.get(key)
+        if task is None:
+            task = self._inflight[key] = asyncio.create_task(self._load(key, fetch))
+            task.add_done_callback(lambda done: self._fetched(key, done))
+        # A caller that disconnects doesn't cancel the fetch the others are waiting on
+        return await asyncio.shield(task)
+
+    def _fetched(self, key: Tuple[str, int], task: asyncio.Task):
+        self._inflight.pop(key, None)
+        if not task.cancelled():
+            task.exception()  # Retrieved here so an error nobody awaited isn't logged as lost
+
+    async def _load(self, key: Tuple[str, int], fetch: Fetch) -> List[Dict]:
+        results = await fetch(*key)
+        now = time.monotonic()
+        ttl = self.ttl if results else SEARCH_CACHE_EMPTY_TTL_SECONDS
+        self._entries[key] = CachedSearch(results, now, now + ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return results
+
+    async def warm(self, queries: Iterable[str], fetch: Fetch, default_limits: Iterable[int]) -> Dict[str, int]:
+        """Refetch popular queries due to expire, at the default limits only"""
+        limits = sorted(set(default_limits))
+        now = time.monotonic()
+        due = []
+        for query in queries:
+            for limit in limits:
+                entry = self._entries.get((query, limit))
+                if entry is None or entry.expires_at - now < self.refresh_ahead:
+                    due.append((query, limit))
+
+        warmed = 0
+        for start in range(0, len(due), SEARCH_WARM_CONCURRENCY):
+            batch = due[start:start + SEARCH_WARM_CONCURRENCY]
+            outcomes = await asyncio.gather(*(self._fetch(key, fetch) for key in batch), return_exceptions=True)
+            warmed += sum(not isinstance(outcome, BaseException) for outcome in outcomes)
+            if any(isinstance(outcome, Overloaded) for outcome in outcomes):
+                # Members are waiting on upstream search; the rest can wait for the next pass
+                print("⚠️ Search warming stopped early: upstream search is busy")
+                break
+        self.counters["warmed"] += warmed
+        return {"due": len(due), "warmed": warmed}
+
+    def stats(self) -> Dict:
+        lookups = self.counters["hits"] + self.counters["misses"]
+        return {
+            **self.counters,
+            "entries": len(self._entries),
+            "in_flight": len(self._inflight),
+            "hit_rate": round(self.counters["hits"] / lookups, 4) if lookups else 0.0
+        }
+
+
+search_cache = SearchCache()
@@ -0,0 +1,190 @@
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from typing import List, Optional, Sequence, Tuple
+
+from services.lazy_import import lazy_module, module_available
+
+np = lazy_module("numpy")
+# Both are optional: without fastembed semantic search is disabled, without hnswlib it falls back to a linear scan
+fastembed = lazy_module("fastembed")
+hnswlib = lazy_module("hnswlib")
+HNSWLIB_AVAILABLE = module_available("hnswlib")
+
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "BAAI/bge-small-en-v1.5")
+SEMANTIC_INDEX_DIR = os.getenv("SEMANTIC_INDEX_DIR", os.path.join(os.path.dirname(os.path.dirname(__file__)), "semantic_index"))
+EMBEDDING_BATCH_SIZE = 256
+HNSW_M = 16
+HNSW_EF_CONSTRUCTION = 200
+HNSW_EF_SEARCH = 64
+INDEX_CHECK_SECONDS = 60
+
+
+class SemanticIndex:
+    """Catalog embeddings stored as an int8 matrix on disk plus an HNSW graph over them.
+
+    vectors.npy holds L2-normalised embeddings scaled to int8 and is memory-mapped,
+    so the resident cost is only the pages touched. HNSW returns candidates that are
+    re-scored exactly against those vectors.
+
+    Each build writes vectors.npy, hnsw.bin and ids.json into a fresh build-*
+    directory and then repoints the index_dir/current symlink at it, so readers
+    always load three files from the same build.
+    """
+
+    def __init__(self, index_dir: str = SEMANTIC_INDEX_DIR, model_name: str = EMBEDDING_MODEL):
+        self.index_dir = index_dir
+        self.model_name = model_name
+        self._model = None
+        self._model_lock = threading.Lock()
+        # (build directory, ids.json mtime) of the loaded index
+        self._loaded_version: Optional[Tuple[str, float]] = None
+        self._last_check = 0.0
+        self.ids: List[str] = []
+        self.vectors: Optional["np.ndarray"] = None
+        self.ann = None
+
+    @property
+    def enabled(self) -> bool:
+        return module_available("fastembed")
+
+    def _current_dir(self) -> Optional[str]:
+        """Directory of the last complete build, or None before the first one"""
+        link = os.path.join(self.index_dir, "current")
+        if os.path.islink(link):
+            return os.path.realpath(link)
+        # Indexes built before versioned directories kept their files at the top level
+        return self.index_dir if os.path.exists(os.path.join(self.index_dir, "ids.json")) else None
+
+    def _get_model(self):
+        with self._model_lock:
+            if self._model is None:
+                self._model = fastembed.TextEmbedding(model_name=self.model_name)
+                print(f"✅ Embedding model {self.model_name} loaded")
+        return self._model
+
+    def embed(self, texts: Sequence[str]) -> "np.ndarray":
+        vectors = np.array(list(self._get_model().embed(list(texts), batch_size=EMBEDDING_BATCH_SIZE)), dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def build(self, catalog: Sequence[Tuple[str, str, str]]) -> int:
+        """Embed (book_id, title, author) rows and write the index files; returns the number indexed"""
+        os.makedirs(self.index_dir, exist_ok=True)
+        build_dir = tempfile.mkdtemp(prefix="build-", dir=self.index_dir)
+        ids = [book_id for book_id, _, _ in catalog]
+        texts = [f"{title} by {author}" for _, title, author in catalog]
+        embeddings = self.embed(texts) if texts else np.zeros((0, 0), dtype=np.float32)
+        quantized = np.clip(np.rint(embeddings * 127), -127, 127).astype(np.int8)
+
+        with open(os.path.join(build_dir, "vectors.npy"), "wb") as f:
+            np.save(f, quantized, allow_pickle=False)
+        if HNSWLIB_AVAILABLE and len(ids):
+            ann = hnswlib.Index(space="ip", dim=quantized.shape[1])
+            ann.init_index(max_elements=len(ids), ef_construction=HNSW_EF_CONSTRUCTION, M=HNSW_M)
+            ann.add_items(quantized.astype(np.float32) / 127, np.arange(len(ids)))
+            ann.save_index(os.path.join(build_dir, "hnsw.bin"))
+        with open(os.path.join(build_dir, "ids.json"), "w", encoding="utf-8") as f:
+            json.dump({"model": self.model_name, "ids": ids}, f)
+
+        # Renaming a new symlink over 'current' swaps the whole build in one step
+        link_tmp = os.path.join(self.index_dir, f"current.{os.getpid()}.tmp")
+        os.symlink(os.path.basename(build_dir), link_tmp)
+        os.replace(link_tmp, os.path.join(self.index_dir, "current"))
+
+        # Processes that already loaded an old build keep their open files and mappings
+        for name in os.listdir(self.index_dir):
+            if name.startswith("build-") and name != os.path.basename(build_dir):
+                shutil.rmtree(os.path.join(self.index_dir, name), ignore_errors=True)
+        return len(ids)
+
+    def _load_if_changed(self):
+        now = time.monotonic()
+        if self._loaded_version is not None and now - self._last_check < INDEX_CHECK_SECONDS:
+            return
+        self._last_check = now
+
+        build_dir = self._current_dir()
+        if build_dir is None:
+            return
+
+        def path(name: str) -> str:
+            return os.path.join(build_dir, name)
+
+        try:
+            version = (build_dir, os.path.getmtime(path("ids.json")))
+            if version == self._loaded_version:
+                return
+            with open(path("ids.json"), encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta["model"] != self.model_name:
+                print(f"⚠️ Semantic index was built with {meta['model']}, expected {self.model_name}; skipping")
+                return
+
+            vectors = np.load(path("vectors.npy"), mmap_mode="r")
+            ann = None
+            if HNSWLIB_AVAILABLE and os.path.exists(path("hnsw.bin")) and len(meta["ids"]):
+                ann = hnswlib.Index(space="ip", dim=vectors.shape[1])
+                ann.load_index(path("hnsw.bin"), max_elements=len(meta["ids"]))
+                ann.set_ef(HNSW_EF_SEARCH)
+        except OSError as e:
+            # A newer build replaced this one while it was being read; the next check picks that up
+            print(f"⚠️ Semantic index changed while loading, keeping the current one: {e}")
+            self._last_check = 0.0
+            return
+
+        self.ids, self.vectors, self.ann = meta["ids"], vectors, ann
+        self._loaded_version = version
+        print(f"✅ Semantic index loaded with {len(self.ids)} books")
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[str, float]]:
+        """Return (book_id, cosine score) pairs, best first"""
+        if not self.enabled:
+            return []
+        self._load_if_changed()
+        if self.vectors is None or not self.ids:
+            return []
+
+        query_vector = self.embed([query])[0]
+        if self.ann is not None:
+            labels, _ = self.ann.knn_query(query_vector, k=min(k * 4, len(self.ids)))
+            # Sorted row order keeps reads from the memory map sequential
+            candidates = np.sort(labels[0].astype(np.int64))
+        else:
+            candidates = np.arange(len(self.ids))
+
+        # Exact re-score on the int8 vectors; the 1/127 scale keeps scores comparable to cosine
+        scores = (np.asarray(self.vectors[candidates], dtype=np.float32) @ query_vector) / 127
+        top = np.argsort(-scores)[:k]
+        return [(self.ids[candidates[i]], float(scores[i])) for i in top]
+
+    async def search_async(self, query: str, k: int = 10) -> List[Tuple[str, float]]:
+        return await asyncio.to_thread(self.search, query, k)
+
+
+semantic_index = SemanticIndex()
+
+
+async def build_from_database(database_url: str) -> int:
+    """Offline build: embed every title in book_inventory"""
+    import asyncpg
+
+    db = await asyncpg.connect(database_url)
+    try:
+        rows = await db.fetch("SELECT book_id, title, author FROM book_inventory ORDER BY book_id")
+    finally:
+        await db.close()
+    return await asyncio.to_thread(semantic_index.build, [(r['book_id'], r['title'], r['author']) for r in rows])
+
+
+if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    started = time.perf_counter()
+    count = asyncio.run(build_from_database(os.getenv("DATABASE_URL")))
+    print(f"✅ Indexed {count} books in {time.perf_counter() - started:.1f}s")
@@ -0,0 +1,84 @@
+import json
+import os
+from collections import Counter
+from typing import Any, Dict, Generic, Optional, Type, TypeVar
+
+from pydantic import BaseModel, ValidationError
+
+# JSON mode makes the model emit bare JSON; the schema additionally constrains its shape
+LLM_JSON_MODE = os.getenv("LLM_JSON_MODE", "true").lower() == "true"
+LLM_RESPONSE_SCHEMA = os.getenv("LLM_RESPONSE_SCHEMA", "true").lower() == "true"
+SCHEMA_KEYS = ("type", "enum", "items", "properties", "required", "description")
+
+T = TypeVar("T", bound=BaseModel)
+
+_decoder = json.JSONDecoder()
+
+
+def extract_json_object(text: str) -> Optional[Dict[str, Any]]:
+    """The first JSON object in text, skipping code fences or prose the model wrapped around it"""
+    start = text.find("{")
+    while start != -1:
+        try:
+            value, _ = _decoder.raw_decode(text, start)
+            if isinstance(value, dict):
+                return value
+        except ValueError:
+            pass
+        start = text.find("{", start + 1)
+    return None
+
+
+def response_schema(model: Type[BaseModel]) -> Dict[str, Any]:
+    """A pydantic model's JSON schema reduced to the OpenAPI subset Gemini accepts"""
+    def reduce(schema: Dict[str, Any]) -> Dict[str, Any]:
+        reduced = {key: schema[key] for key in SCHEMA_KEYS if key in schema}
+        if "items" in reduced:
+            reduced["items"] = reduce(reduced["items"])
+        if "properties" in reduced:
+            reduced["properties"] = {name: reduce(prop) for name, prop in reduced["properties"].items()}
+        return reduced
+    return reduce(model.model_json_schema())
+
+
+class StructuredOutputParser(Generic[T]):
+    """Parses model replies into a typed model and counts how each parse went.
+
+    Outcomes: 'json' (the reply was clean JSON), 'extracted' (the object had to
+    be dug out of surrounding text), 'no_json' and 'invalid' (failed validation).
+    """
+
+    def __init__(self, model: Type[T]):
+        self.model = model
+        self.stats: Counter = Counter()
+        self.generation_config: Dict[str, Any] = {}
+        if LLM_JSON_MODE:
+            self.generation_config["responseMimeType"] = "application/json"
+            if LLM_RESPONSE_SCHEMA:
+                self.generation_config["responseSchema"] = response_schema(model)
+
+    def parse(self, text: str) -> Optional[T]:
+        try:
+            data = json.loads(text)
+            outcome = "json"
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            data = extract_json_object(text)
+            outcome = "extracted"
+        if data is None:
+            self.stats["no_json"] += 1
+            return None
+
+        try:
+            result = self.model.model_validate(data)
+        except ValidationError as e:
+            self.stats["invalid"] += 1
+            print(f"⚠️ LLM reply failed {self.model.__name__} validation: {e.error_count()} errors")
+            return None
+        self.stats[outcome] += 1
+        return result
+
+    def failure_rate(self) -> float:
+        total = sum(self.stats.values())
+        return (self.stats["no_json"] + self.stats["invalid"]) / total if total else 0.0
@@ -0,0 +1,168 @@
+import asyncio
+import heapq
+import os
+import re
+import unicodedata
+from array import array
+from bisect import bisect_left, insort
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+import asyncpg
+
+from services.query_log import QueryLog, query_log as default_query_log
+
+SUGGEST_REFRESH_MINUTES = int(os.getenv("SUGGEST_REFRESH_MINUTES", "10"))
+# Prefixes this short match too many keys to scan, so their top completions are precomputed
+SHORT_PREFIX_LENGTH = 3
+SHORT_PREFIX_TOP_K = 20
+# Longer prefixes scan at most this many keys; enough for a full range on any realistic catalog
+MAX_SCAN = 2000
+# Popular searches from the query log are offered once repeated
+POPULAR_QUERIES = 500
+MIN_QUERY_COUNT = 2
+MAX_COMPLETION_LENGTH = 120
+
+_separators = re.compile(r"[^\w]+")
+
+
+def normalize(text: str) -> str:
+    """Case-folded, accent-stripped words separated by single spaces"""
+    text = unicodedata.normalize("NFKD", text.casefold())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return " ".join(_separators.sub(" ", text).split())
+
+
+class Completion(NamedTuple):
+    text: str
+    kind: str  # 'title', 'author' or 'query'
+    weight: float
+    book_id: Optional[str] = None
+
+
+def completion_keys(completion: Completion) -> List[str]:
+    """A key per word start, so 'pott' finds 'Harry Potter' as well as 'harr'"""
+    words = normalize(completion.text).split()
+    return [" ".join(words[i:]) for i in range(len(words))]
+
+
+class PrefixIndex:
+    """Immutable sorted array of keys with bisect lookups.
+
+    keys[i] points at completions[refs[i]]. Completions for prefixes of up to
+    SHORT_PREFIX_LENGTH characters are ranked once at build time; longer prefixes
+    bisect to their range and rank what they find, scanning at most MAX_SCAN keys.
+    """
+
+    def __init__(self, completions: List[Completion]):
+        self.completions = completions
+        pairs = sorted((key, i) for i, completion in enumerate(completions) for key in completion_keys(completion))
+        self.keys = [key for key, _ in pairs]
+        self.refs = array("I", (i for _, i in pairs))
+
+        short: Dict[str, set] = defaultdict(set)
+        for key, i in pairs:
+            for length in range(1, SHORT_PREFIX_LENGTH + 1):
+                if len(key) >= length:
+                    short[key[:length]].add(i)
+        self.short = {
+            prefix: heapq.nlargest(SHORT_PREFIX_TOP_K, refs, key=lambda i: completions[i].weight)
+            for prefix, refs in short.items()
+        }
+
+    def __len__(self) -> int:
+        return len(self.completions)
+
+    def lookup(self, prefix: str) -> List[Completion]:
+        if len(prefix) <= SHORT_PREFIX_LENGTH:
+            return [self.completions[i] for i in self.short.get(prefix, ())]
+        found = {}
+        start = bisect_left(self.keys, prefix)
+        for position in range(start, min(start + MAX_SCAN, len(self.keys))):
+            if not self.keys[position].startswith(prefix):
+                break
+            found[self.refs[position]] = None
+        return [self.completions[i] for i in found]
+
+
+class SuggestService:
+    """Title, author and popular-query completions for typeahead.
+
+    The prefix index is rebuilt off the event loop when the catalog or the set
+    of popular queries changes, then swapped in. Titles stocked in between go
+    into a small sorted delta that lookups merge until the next rebuild.
+    """
+
+    def __init__(self, queries: QueryLog = default_query_log):
+        self.index = PrefixIndex([])
+        self._delta: List[Tuple[str, Completion]] = []
+        self.queries = queries
+        self._catalog_version = None
+        self._popular: frozenset = frozenset()
+
+    def popular_queries(self) -> Dict[str, int]:
+        popular = self.queries.popular(POPULAR_QUERIES, MIN_QUERY_COUNT)
+        return {query: round(count) for query, count in popular.items() if normalize(query)}
+
+    def add_title(self, book_id: str, title: str, author: str):
+        """Make a newly stocked title suggestible before the next rebuild"""
+        for completion in (Completion(title, "title", 1, book_id), Completion(author, "author", 1)):
+            for key in completion_keys(completion):
+                insort(self._delta, (key, completion))
+
+    def suggest(self, prefix: str, limit: int = 8) -> List[Completion]:
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        candidates = self.index.lookup(prefix)
+        if self._delta:
+            start = bisect_left(self._delta, (prefix,))
+            for key, completion in self._delta[start:start + MAX_SCAN]:
+                if not key.startswith(prefix):
+                    break
+                candidates.append(completion)
+
+        best: Dict[Tuple[str, str], Completion] = {}
+        for completion in candidates:
+            key = (completion.kind, completion.text.casefold())
+            if key not in best or completion.weight > best[key].weight:
+                best[key] = completion
+        return heapq.nlargest(limit, best.values(), key=lambda c: (c.weight, -len(c.text)))
+
+    async def refresh(self, db: asyncpg.Connection, force: bool = False) -> bool:
+        """Rebuild the index if the catalog or popular queries changed; returns whether it did"""
+        version = tuple(await db.fetchrow("SELECT COUNT(*), MAX(updated_at) FROM book_inventory"))
+        popular = self.popular_queries()
+        if not force and version == self._catalog_version and frozenset(popular) == self._popular:
+            return False
+
+        pending = {completion for _, completion in self._delta}
+        rows = await db.fetch("""
+            SELECT i.book_id, i.title, i.author, COALESCE(c.borrow_count, 0) AS borrow_count
+            FROM book_inventory i
+            LEFT JOIN mv_book_borrow_counts c ON c.book_id = i.book_id
+        """)
+        index = await asyncio.to_thread(PrefixIndex, build_completions(rows, popular))
+        self.index = index
+        # Anything added while the rows were being read stays in the delta until next time
+        self._delta = [(key, completion) for key, completion in self._delta if completion not in pending]
+        self._catalog_version, self._popular = version, frozenset(popular)
+        print(f"🔤 Suggest index rebuilt with {len(index)} completions")
+        return True
+
+
+def build_completions(rows: Iterable, popular: Dict[str, int]) -> List[Completion]:
+    completions = []
+    authors: Counter = Counter()
+    for row in rows:
+        # Every stocked title counts once even if it was never borrowed
+        weight = 1 + row['borrow_count']
+        completions.append(Completion(row['title'][:MAX_COMPLETION_LENGTH], "title", weight, row['book_id']))
+        if row['author']:
+            authors[row['author'][:MAX_COMPLETION_LENGTH]] += weight
+    completions.extend(Completion(author, "author", weight) for author, weight in authors.items())
+    completions.extend(Completion(query, "query", count) for query, count in popular.items())
+    return completions
+
+
+suggest_service = SuggestService()
@@ -0,0 +1,264 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, Iterable, List, Optional, Tuple
+
+from services.lazy_import import lazy_module
+from services.rate_limit import TokenBucket
+
+aiohttp = lazy_module("aiohttp")
+
+TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN", "")
+# Used to build t.me deep links for account linking
+TELEGRAM_BOT_USERNAME = os.getenv("TELEGRAM_BOT_USERNAME", "")
+# Point at a local fake Bot API server for tests
+TELEGRAM_API_BASE = os.getenv("TELEGRAM_API_BASE", "https://api.telegram.org")
+# Sent back by Telegram in X-Telegram-Bot-Api-Secret-Token on every webhook call
+TELEGRAM_WEBHOOK_SECRET = os.getenv("TELEGRAM_WEBHOOK_SECRET", "")
+# Long-poll getUpdates instead of receiving webhooks, for local development
+TELEGRAM_POLLING = os.getenv("TELEGRAM_POLLING", "false").lower() == "true"
+# Telegram allows about 30 messages a second overall and one a second to the same chat
+TELEGRAM_GLOBAL_PER_SECOND = float(os.getenv("TELEGRAM_GLOBAL_PER_SECOND", "25"))
+TELEGRAM_CHAT_PER_MINUTE = float(os.getenv("TELEGRAM_CHAT_PER_MINUTE", "60"))
+TELEGRAM_MAX_CONCURRENCY = int(os.getenv("TELEGRAM_MAX_CONCURRENCY", "8"))
+TELEGRAM_MAX_ATTEMPTS = 3
+# A chat whose send hit a 5xx or network error waits this long, doubling per attempt, before the retry
+TELEGRAM_RETRY_BASE_SECONDS = 1.0
+TELEGRAM_POLL_TIMEOUT_SECONDS = 25
+TELEGRAM_MAX_MESSAGE_LENGTH = 4096
+TELEGRAM_MAX_CHATS = 10000
+
+
+class TelegramError(Exception):
+    def __init__(self, status: int, description: str, retry_after: Optional[float] = None):
+        super().__init__(f"Telegram returned {status}: {description}")
+        self.status = status
+        self.retry_after = retry_after
+
+
+class TelegramBotAPI:
+    """Minimal Bot API client on a pooled aiohttp session"""
+
+    def __init__(self, token: str, base_url: str = TELEGRAM_API_BASE):
+        self.url = f"{base_url.rstrip('/')}/bot{token}"
+        self._session: Optional["aiohttp.ClientSession"] = None
+
+    def _get_session(self) -> "aiohttp.ClientSession":
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=TELEGRAM_MAX_CONCURRENCY * 2, keepalive_timeout=60),
+                timeout=aiohttp.ClientTimeout(total=TELEGRAM_POLL_TIMEOUT_SECONDS + 10),
+            )
+        return self._session
+
+    async def call(self, method: str, **params) -> Any:
+        async with self._get_session().post(f"{self.url}/{method}", json=params) as response:
+            payload = await response.json(content_type=None)
+        if not payload.get("ok"):
+            retry_after = (payload.get("parameters") or {}).get("retry_after")
+            raise TelegramError(payload.get("error_code", response.status), payload.get("description", ""), retry_after)
+        return payload["result"]
+
+    async def send_message(self, chat_id: str, text: str) -> Dict:
+        return await self.call("sendMessage", chat_id=chat_id, text=text[:TELEGRAM_MAX_MESSAGE_LENGTH])
+
+    async def get_updates(self, offset: Optional[int] = None) -> List[Dict]:
+        return await self.call("getUpdates", offset=offset, timeout=TELEGRAM_POLL_TIMEOUT_SECONDS,
+                               allowed_updates=["message"])
+
+    async def close(self):
+        if self._session and not self._session.closed:
+            await self._session.close()
+
+
+@dataclass
+class OutgoingMessage:
+    chat_id: str
+    text: str
+    attempts: int = 0
+
+
+class TelegramSender:
+    """Delivers messages under Telegram's rate limits.
+
+    Messages wait in a FIFO queue per chat. The dispatcher visits chats round-robin
+    and takes at most one message per chat per pass, subject to a global token
+    bucket and one bucket per chat, then sends the pass as a batch of at most
+    max_concurrency concurrent requests. A 429 pauses just that chat for the
+    retry_after Telegram asks for, and a 5xx or network error for an exponential
+    backoff; either way the message goes back to the head of its queue.
+    """
+
+    def __init__(self, api: TelegramBotAPI, global_per_second: float = TELEGRAM_GLOBAL_PER_SECOND,
+                 chat_per_minute: float = TELEGRAM_CHAT_PER_MINUTE, max_concurrency: int = TELEGRAM_MAX_CONCURRENCY):
+        self.api = api
+        self.chat_per_minute = chat_per_minute
+        self.max_concurrency = max_concurrency
+        self._global = TokenBucket(global_per_second, global_per_second * 60, time.monotonic())
+        self._chat_buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._queues: Dict[str, Deque[OutgoingMessage]] = {}
+        self._ready: Deque[str] = deque()
+        self._paused_until: Dict[str, float] = {}
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.stats: Dict[str, int] = {"sent": 0, "rate_limited": 0, "failed": 0}
+
+    def submit(self, chat_id: str, text: str):
+        self._enqueue(OutgoingMessage(str(chat_id), text))
+        self._wakeup.set()
+
+    def submit_many(self, messages: Iterable[Tuple[str, str]]):
+        for chat_id, text in messages:
+            self._enqueue(OutgoingMessage(str(chat_id), text))
+        self._wakeup.set()
+
+    def _enqueue(self, message: OutgoingMessage, front: bool = False):
+        queue = self._queues.get(message.chat_id)
+        if queue is None:
+            queue = self._queues[message.chat_id] = deque()
+            self._ready.append(message.chat_id)
+        if front:
+            queue.appendleft(message)
+        else:
+            queue.append(message)
+
+    def pending(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    def _chat_bucket(self, chat_id: str, now: float) -> TokenBucket:
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._chat_buckets[chat_id] = TokenBucket(1, self.chat_per_minute, now)
+            if len(self._chat_buckets) > TELEGRAM_MAX_CHATS:
+                self._chat_buckets.popitem(last=False)
+        else:
+            self._chat_buckets.move_to_end(chat_id)
+        return bucket
+
+    def _next_batch(self) -> Tuple[List[OutgoingMessage], float]:
+        """Messages that may go out now, and how long to wait before trying again otherwise"""
+        now = time.monotonic()
+        batch: List[OutgoingMessage] = []
+        wait = 1.0
+        for _ in range(len(self._ready)):
+            if len(batch) >= self.max_concurrency:
+                break
+            chat_id = self._ready.popleft()
+            paused = self._paused_until.get(chat_id, 0) - now
+            if paused > 0:
+                self._ready.append(chat_id)
+                wait = min(wait, paused)
+                continue
+            self._paused_until.pop(chat_id, None)
+
+            chat_wait = self._chat_bucket(chat_id, now).take(now)
+            if chat_wait:
+                self._ready.append(chat_id)
+                wait = min(wait, chat_wait)
+                continue
+            global_wait = self._global.take(now)
+            if global_wait:
+                # Give the chat its token back; nothing else can go out this pass either
+                self._chat_buckets[chat_id].tokens += 1
+                self._ready.appendleft(chat_id)
+                return batch, min(wait, global_wait)
+
+            queue = self._queues[chat_id]
+            batch.append(queue.popleft())
+            if queue:
+                self._ready.append(chat_id)
+            else:
+                del self._queues[chat_id]
+        return batch, wait
+
+    async def _send(self, message: OutgoingMessage):
+        message.attempts += 1
+        try:
+            await self.api.send_message(message.chat_id, message.text)
+            self.stats["sent"] += 1
+            return
+        except TelegramError as e:
+            if e.status == 429:
+                self.stats["rate_limited"] += 1
+                self._paused_until[message.chat_id] = time.monotonic() + (e.retry_after or 1)
+                print(f"⚠️ Telegram rate limited chat {message.chat_id} for {e.retry_after}s")
+                self._enqueue(message, front=True)
+                return
+            if e.status < 500:
+                # Blocked the bot, chat not found, bad request: retrying won't help
+                self.stats["failed"] += 1
+                print(f"❌ Telegram message to {message.chat_id} dropped: {e}")
+                return
+            error = e
+        except Exception as e:
+            # Network errors, timeouts, a non-JSON reply from a proxy; never let one kill the dispatcher
+            error = e
+        if message.attempts < TELEGRAM_MAX_ATTEMPTS:
+            delay = TELEGRAM_RETRY_BASE_SECONDS * 2 ** (message.attempts - 1)
+            self._paused_until[message.chat_id] = time.monotonic() + delay
+            print(f"⚠️ Telegram message to {message.chat_id} failed, retrying in {delay:.0f}s: {error!r}")
+            self._enqueue(message, front=True)
+        else:
+            self.stats["failed"] += 1
+            print(f"❌ Telegram message to {message.chat_id} failed after {message.attempts} attempts: {error!r}")
+
+    async def _run(self):
+        while True:
+            batch, wait = self._next_batch()
+            if batch:
+                await asyncio.gather(*(self._send(message) for message in batch))
+                continue
+            self._wakeup.clear()
+            if self._ready:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=wait)
+                except asyncio.TimeoutError:
+                    pass
+            else:
+                await self._wakeup.wait()
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self, drain_timeout: float = 5.0):
+        """Give queued messages a moment to go out, then stop the dispatcher"""
+        deadline = time.monotonic() + drain_timeout
+        while self.pending() and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        await self.api.close()
+
+
+def parse_update(update: Dict) -> Optional[Tuple[str, str]]:
+    """(chat_id, text) of an incoming text message, or None for anything else"""
+    message = update.get("message") or {}
+    text = message.get("text")
+    chat_id = (message.get("chat") or {}).get("id")
+    if not text or chat_id is None:
+        return None
+    return str(chat_id), text.strip()
+
+
+def format_reply(ai_response: Dict, max_items: int = 5) -> str:
+    """Plain-text rendering of a chat response, listing the first few books it carries"""
+    lines = [ai_response.get("message", "")]
+    # data is a list of books for searches and loans, but a dict for library info and the like
+    data = ai_response.get("data")
+    items = data if isinstance(data, list) else []
+    for item in items[:max_items]:
+        title = getattr(item, "title", None) or getattr(item, "book_title", None)
+        author = getattr(item, "author", None) or getattr(item, "book_author", None)
+        if title:
+            lines.append(f"• {title}" + (f" by {author}" if author else ""))
+    if len(items) > max_items:
+        lines.append(f"…and {len(items) - max_items} more in the app")
+    return "\n".join(line for line in lines if line)
+
+
+telegram_api = TelegramBotAPI(TELEGRAM_BOT_TOKEN) if TELEGRAM_BOT_TOKEN else None
+telegram_sender = TelegramSender(telegram_api) if telegram_api else None
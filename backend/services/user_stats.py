@@ -0,0 +1,125 @@
+from datetime import date
+from decimal import Decimal
+from typing import AsyncContextManager, Callable, Optional
+
+import asyncpg
+
+
+class UserStatsService:
+    """Per-user library stats snapshot kept in the user_stats table.
+
+    Rows are valid for a single stats_date because fines grow daily. Issue, renew
+    and return apply deltas to today's row; the daily rollover (or the first read
+    of a stale row) recomputes from issued_books.
+    """
+
+    def __init__(self, fine_per_day: int, max_renewals: int):
+        self.fine_per_day = fine_per_day
+        self.max_renewals = max_renewals
+
+    async def init_table(self, db: asyncpg.Connection):
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS user_stats (
+                user_id INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+                issued_count INTEGER NOT NULL DEFAULT 0,
+                overdue_count INTEGER NOT NULL DEFAULT 0,
+                total_fine DECIMAL(10, 2) NOT NULL DEFAULT 0.00,
+                renewals_left INTEGER NOT NULL DEFAULT 0,
+                stats_date DATE NOT NULL DEFAULT CURRENT_DATE,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        await db.execute("""
+            CREATE INDEX IF NOT EXISTS idx_issued_books_user_status
+            ON issued_books (user_id, status)
+        """)
+
+    async def refresh(self, db: asyncpg.Connection, user_id: Optional[int] = None):
+        """Recompute snapshots from issued_books for one user, or every user when user_id is None"""
+        await db.execute("""
+            INSERT INTO user_stats (user_id, issued_count, overdue_count, total_fine, renewals_left, stats_date, updated_at)
+            SELECT u.id,
+                   COUNT(b.id),
+                   COUNT(b.id) FILTER (WHERE b.due_date < $1),
+                   COALESCE(SUM(GREATEST($1 - b.due_date, 0)), 0) * $2,
+                   COALESCE(SUM(GREATEST($3 - b.renewal_count, 0)), 0),
+                   $1,
+                   CURRENT_TIMESTAMP
+            FROM users u
+            LEFT JOIN issued_books b ON b.user_id = u.id AND b.status = 'issued'
+            WHERE $4::INTEGER IS NULL OR u.id = $4
+            GROUP BY u.id
+            ON CONFLICT (user_id) DO UPDATE SET
+                issued_count = EXCLUDED.issued_count,
+                overdue_count = EXCLUDED.overdue_count,
+                total_fine = EXCLUDED.total_fine,
+                renewals_left = EXCLUDED.renewals_left,
+                stats_date = EXCLUDED.stats_date,
+                updated_at = EXCLUDED.updated_at
+        """, date.today(), self.fine_per_day, self.max_renewals, user_id)
+
+    async def _apply_delta(self, db: asyncpg.Connection, user_id: int, issued: int = 0,
+                           overdue: int = 0, fine: Decimal = Decimal('0.00'), renewals: int = 0):
+        status = await db.execute("""
+            UPDATE user_stats
+            SET issued_count = issued_count + $2,
+                overdue_count = overdue_count + $3,
+                total_fine = total_fine + $4,
+                renewals_left = renewals_left + $5,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE user_id = $1 AND stats_date = $6
+        """, user_id, issued, overdue, fine, renewals, date.today())
+
+        # No row for today yet: a full recompute already reflects the change
+        if status == "UPDATE 0":
+            await self.refresh(db, user_id)
+
+    def _overdue_and_fine(self, due_date: date):
+        overdue_days = (date.today() - due_date).days
+        if overdue_days > 0:
+            return 1, Decimal(overdue_days * self.fine_per_day)
+        return 0, Decimal('0.00')
+
+    async def on_issue(self, db: asyncpg.Connection, user_id: int):
+        await self._apply_delta(db, user_id, issued=1, renewals=self.max_renewals)
+
+    async def on_renew(self, db: asyncpg.Connection, user_id: int, old_due_date: date, new_due_date: date):
+        old_overdue, old_fine = self._overdue_and_fine(old_due_date)
+        new_overdue, new_fine = self._overdue_and_fine(new_due_date)
+        await self._apply_delta(db, user_id, overdue=new_overdue - old_overdue,
+                                fine=new_fine - old_fine, renewals=-1)
+
+    async def on_return(self, db: asyncpg.Connection, user_id: int, due_date: date, renewal_count: int):
+        overdue, fine = self._overdue_and_fine(due_date)
+        await self._apply_delta(db, user_id, issued=-1, overdue=-overdue, fine=-fine,
+                                renewals=-max(self.max_renewals - renewal_count, 0))
+
+    async def get_profile_row(self, db: asyncpg.Connection, user_id: int,
+                              primary: Optional[Callable[[], AsyncContextManager[asyncpg.Connection]]] = None
+                              ) -> Optional[asyncpg.Record]:
+        """User row joined with today's stats snapshot, refreshing the snapshot if stale.
+
+        db may be a read replica; a stale snapshot is then refreshed and re-read on a
+        connection taken from primary(), so one is only checked out when needed.
+        """
+        query = """
+            SELECT u.id, u.email, u.first_name, u.last_name, u.preferences, u.created_at,
+                   s.issued_count, s.overdue_count, s.total_fine, s.renewals_left, s.stats_date
+            FROM users u
+            LEFT JOIN user_stats s ON s.user_id = u.id
+            WHERE u.id = $1
+        """
+        row = await db.fetchrow(query, user_id)
+        if row and row['stats_date'] != date.today():
+            if primary is None:
+                await self.refresh(db, user_id)
+                return await db.fetchrow(query, user_id)
+            async with primary() as primary_db:
+                db = primary_db or db
+                await self.refresh(db, user_id)
+                row = await db.fetchrow(query, user_id)
+        return row
+
+    async def daily_rollover(self, db: asyncpg.Connection):
+        await self.refresh(db)
+        print("✅ User stats snapshots rolled over")
@@ -0,0 +1,89 @@
+from datetime import date, datetime, time, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Iterable, Optional, Tuple
+
+import asyncpg
+
+from services.compression import decoded_etag
+
+# What each versioned endpoint depends on, and whether it also changes at midnight (fines grow daily)
+STATE_KINDS = {
+    "issued_books": ("loans", True),
+    "profile": ("loans", True),
+    "notifications": ("notifications", False),
+}
+COUNTERS = ("loans", "notifications")
+
+
+class UserVersionService:
+    """Per-user version counters for conditional GETs.
+
+    Writes bump the counter for what they changed in the same transaction, so
+    a matching If-None-Match can be answered with one primary-key lookup
+    instead of the queries behind the response.
+    """
+
+    async def init_table(self, db: asyncpg.Connection):
+        await db.execute("""
+            CREATE TABLE IF NOT EXISTS user_versions (
+                user_id INTEGER PRIMARY KEY REFERENCES users(id) ON DELETE CASCADE,
+                loans_version BIGINT NOT NULL DEFAULT 0,
+                loans_changed_at TIMESTAMP NOT NULL DEFAULT timezone('utc', now()),
+                notifications_version BIGINT NOT NULL DEFAULT 0,
+                notifications_changed_at TIMESTAMP NOT NULL DEFAULT timezone('utc', now())
+            )
+        """)
+
+    async def bump(self, db: asyncpg.Connection, user_id: int, counter: str):
+        await self.bump_many(db, [user_id], counter)
+
+    async def bump_many(self, db: asyncpg.Connection, user_ids: Iterable[int], counter: str):
+        if counter not in COUNTERS:
+            raise ValueError(f"Unknown version counter: {counter}")
+        await db.execute(f"""
+            INSERT INTO user_versions (user_id, {counter}_version)
+            SELECT DISTINCT unnest($1::INTEGER[]), 1
+            ON CONFLICT (user_id) DO UPDATE
+            SET {counter}_version = user_versions.{counter}_version + 1,
+                {counter}_changed_at = timezone('utc', now())
+        """, list(user_ids))
+
+    async def validators(self, db: asyncpg.Connection, user_id: int, kind: str) -> Tuple[str, datetime]:
+        """(ETag, Last-Modified) for one user's view of an endpoint"""
+        counter, daily = STATE_KINDS[kind]
+        row = await db.fetchrow(
+            f"SELECT {counter}_version AS version, {counter}_changed_at AS changed_at FROM user_versions WHERE user_id = $1",
+            user_id
+        )
+        version = row['version'] if row else 0
+        changed_at = row['changed_at'].replace(tzinfo=timezone.utc) if row else datetime(2000, 1, 1, tzinfo=timezone.utc)
+
+        tag = f"{kind}-{user_id}-{version}"
+        if daily:
+            today = date.today()
+            tag += f"-{today.isoformat()}"
+            changed_at = max(changed_at, datetime.combine(today, time.min).astimezone(timezone.utc))
+        return f'W/"{tag}"', changed_at.replace(microsecond=0)
+
+
+def not_modified(if_none_match: Optional[str], if_modified_since: Optional[str], etag: str,
+                 last_modified: datetime) -> bool:
+    """RFC 9110 evaluation: If-None-Match wins when present, otherwise If-Modified-Since"""
+    if if_none_match:
+        candidates = [tag.strip() for tag in if_none_match.split(",")]
+        # Weak comparison: W/"x" and "x" match, as do the "x-gzip"/"x-br" tags of compressed responses
+        opaque = decoded_etag(etag.removeprefix("W/"))
+        return "*" in candidates or opaque in (decoded_etag(tag.removeprefix("W/")) for tag in candidates)
+    if if_modified_since:
+        try:
+            return last_modified <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def http_date(moment: datetime) -> str:
+    return format_datetime(moment, usegmt=True)
+
+
+user_version_service = UserVersionService()
@@ -0,0 +1,126 @@
+import time
+
+import pytest
+import pytest_asyncio
+from aiohttp import web
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwk, jwt
+
+from services.auth import AuthError, JWKSCache, TokenVerifier, bearer_token
+
+
+def generate_key(kid: str):
+    """(private PEM, public JWK) for a fresh RSA key"""
+    private = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    private_pem = private.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    ).decode()
+    public_pem = private.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+    ).decode()
+    public_jwk = {**jwk.construct(public_pem, "RS256").to_dict(), "kid": kid, "use": "sig"}
+    return private_pem, public_jwk
+
+
+def sign(private_pem: str, kid: str, **claims) -> str:
+    claims = {"sub": "user_1", "iss": "https://clerk.test", "exp": int(time.time()) + 60, **claims}
+    return jwt.encode(claims, private_pem, algorithm="RS256", headers={"kid": kid})
+
+
+@pytest_asyncio.fixture
+async def jwks_server():
+    """A local JWKS endpoint; tests add public keys to the returned list"""
+    keys, requests = [], []
+
+    async def jwks(request):
+        requests.append(request)
+        return web.json_response({"keys": keys})
+
+    app = web.Application()
+    app.router.add_get("/.well-known/jwks.json", jwks)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    yield f"http://127.0.0.1:{port}/.well-known/jwks.json", keys, requests
+    await runner.cleanup()
+
+
+def verifier(url: str, **kwargs) -> TokenVerifier:
+    return TokenVerifier(JWKSCache(url), issuer="https://clerk.test", audience="", **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_valid_token_is_verified_and_memoized(jwks_server):
+    url, keys, requests = jwks_server
+    private_pem, public_jwk = generate_key("k1")
+    keys.append(public_jwk)
+    tokens = verifier(url, authorized_parties=["http://localhost:3000"])
+    token = sign(private_pem, "k1", azp="http://localhost:3000")
+
+    claims = await tokens.verify(token)
+    assert claims["sub"] == "user_1"
+    assert await tokens.verify(token) is claims
+    assert len(requests) == 1
+
+
+@pytest.mark.asyncio
+async def test_rotated_key_is_fetched_on_first_use(jwks_server):
+    url, keys, requests = jwks_server
+    old_pem, old_jwk = generate_key("old")
+    keys.append(old_jwk)
+    tokens = verifier(url)
+    await tokens.verify(sign(old_pem, "old"))
+
+    new_pem, new_jwk = generate_key("new")
+    keys.append(new_jwk)
+    tokens.jwks._fetched_at = 0.0  # Past the refetch guard
+    assert (await tokens.verify(sign(new_pem, "new")))["sub"] == "user_1"
+    assert len(requests) == 2
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("claims, message", [
+    ({"exp": int(time.time()) - 3600}, "Invalid token"),
+    ({"iss": "https://evil.test"}, "Invalid token"),
+    ({"azp": "https://evil.test"}, "another origin"),
+])
+async def test_bad_claims_are_rejected(jwks_server, claims, message):
+    url, keys, _ = jwks_server
+    private_pem, public_jwk = generate_key("k1")
+    keys.append(public_jwk)
+    tokens = verifier(url, authorized_parties=["http://localhost:3000"])
+
+    with pytest.raises(AuthError, match=message):
+        await tokens.verify(sign(private_pem, "k1", **{"azp": "http://localhost:3000", **claims}))
+
+
+@pytest.mark.asyncio
+async def test_token_signed_by_an_unknown_key_is_rejected(jwks_server):
+    url, keys, _ = jwks_server
+    _, public_jwk = generate_key("k1")
+    keys.append(public_jwk)
+    other_pem, _ = generate_key("k1")
+
+    with pytest.raises(AuthError, match="Invalid token"):
+        await verifier(url).verify(sign(other_pem, "k1"))
+    with pytest.raises(AuthError, match="unknown key"):
+        await verifier(url).verify(sign(other_pem, "missing"))
+
+
+@pytest.mark.asyncio
+async def test_malformed_and_unsupported_tokens_are_rejected(jwks_server):
+    url, _, _ = jwks_server
+    with pytest.raises(AuthError, match="Malformed"):
+        await verifier(url).verify("not-a-jwt")
+    hs256 = jwt.encode({"sub": "user_1", "exp": int(time.time()) + 60}, "secret", algorithm="HS256")
+    with pytest.raises(AuthError, match="Unsupported"):
+        await verifier(url).verify(hs256)
+
+
+def test_bearer_token():
+    assert bearer_token("Bearer abc ") == "abc"
+    assert bearer_token("Basic abc") is None
+    assert bearer_token(None) is None
@@ -0,0 +1,100 @@
+import zlib
+from datetime import datetime
+
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from services import compression
+from services.compression import CompressionMiddleware, choose_encoding, decoded_etag, encoded_etag
+from services.user_versions import not_modified
+
+ETAG = 'W/"profile-1-3"'
+BODY = {"text": "x" * 4000}
+
+
+@pytest.mark.parametrize("accept, brotli, expected", [
+    ("gzip, deflate, br", True, "br"),
+    ("gzip, deflate, br", False, "gzip"),
+    ("br;q=0, gzip", True, "gzip"),
+    ("gzip;q=0.5", True, "gzip"),
+    ("*", True, "br"),
+    ("identity", True, None),
+    ("gzip;q=0", True, None),
+    ("", True, None),
+])
+def test_choose_encoding(monkeypatch, accept, brotli, expected):
+    monkeypatch.setattr(compression, "BROTLI_AVAILABLE", brotli)
+    assert choose_encoding(accept) == expected
+
+
+@pytest.mark.parametrize("etag", ['"abc"', 'W/"abc"'])
+@pytest.mark.parametrize("encoding", ["gzip", "br"])
+def test_etag_round_trip(etag, encoding):
+    encoded = encoded_etag(etag, encoding)
+    assert encoded != etag and encoded.endswith(f'-{encoding}"')
+    assert decoded_etag(encoded) == etag
+
+
+def test_not_modified_accepts_both_forms():
+    now = datetime.now()
+    for tag in ('W/"profile-1-3"', '"profile-1-3"', 'W/"profile-1-3-gzip"', '"profile-1-3-br"', '"x", W/"profile-1-3-gzip"'):
+        assert not_modified(tag, None, ETAG, now)
+    assert not not_modified('W/"profile-1-4-gzip"', None, ETAG, now)
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(compression, "BROTLI_AVAILABLE", False)
+
+    def endpoint(request):
+        if not_modified(request.headers.get("if-none-match"), None, ETAG, datetime.now()):
+            return Response(status_code=304, headers={"ETag": ETAG})
+        return JSONResponse(BODY, headers={"ETag": ETAG})
+
+    def small(request):
+        return JSONResponse({"ok": True}, headers={"ETag": '"small"'})
+
+    app = Starlette(routes=[Route("/", endpoint), Route("/small", small)])
+    app.add_middleware(CompressionMiddleware)
+    return TestClient(app)
+
+
+def test_compressed_response_gets_its_own_etag(client):
+    response = client.get("/", headers={"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert response.headers["etag"] == 'W/"profile-1-3-gzip"'
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert response.json() == BODY
+
+    plain = client.get("/", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in plain.headers
+    assert plain.headers["etag"] == ETAG
+
+
+def test_revalidation_echoes_the_tag_the_client_holds(client):
+    compressed = client.get("/", headers={"Accept-Encoding": "gzip"}).headers["etag"]
+    response = client.get("/", headers={"Accept-Encoding": "gzip", "If-None-Match": compressed})
+    assert response.status_code == 304
+    assert response.headers["etag"] == compressed
+
+    response = client.get("/", headers={"Accept-Encoding": "gzip", "If-None-Match": ETAG})
+    assert response.status_code == 304
+    assert response.headers["etag"] == ETAG
+
+
+def test_small_responses_pass_through(client):
+    response = client.get("/small", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+    assert response.headers["etag"] == '"small"'
+
+
+def test_stream_compressor_flushes_decodable_chunks():
+    compressor = compression.StreamCompressor("gzip")
+    first = compressor.compress(b"a" * 100, final=False)
+    decoder = zlib.decompressobj(zlib.MAX_WBITS | 16)
+    assert decoder.decompress(first) == b"a" * 100
+    rest = compressor.compress(b"b" * 100, final=True)
+    assert decoder.decompress(rest) == b"b" * 100
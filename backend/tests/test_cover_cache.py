@@ -0,0 +1,38 @@
+import asyncio
+
+import pytest
+
+from services.cover_cache import CoverCache
+
+
+@pytest.mark.asyncio
+async def test_waiters_are_released_when_the_leader_is_cancelled(tmp_path):
+    cache = CoverCache(root=str(tmp_path))
+    started = asyncio.Event()
+
+    async def slow_fetch(cover_id):
+        started.set()
+        await asyncio.sleep(60)
+
+    cache._fetch = slow_fetch
+    leader = asyncio.create_task(cache.get("ol-1"))
+    await started.wait()
+    waiter = asyncio.create_task(cache.get("ol-1"))
+    # Let the waiter get past its cache lookup and start waiting on the leader's fetch
+    await asyncio.sleep(0.2)
+    leader.cancel()
+
+    assert await asyncio.wait_for(waiter, timeout=1) is None
+    assert cache._inflight == {}
+
+
+@pytest.mark.asyncio
+async def test_read_of_an_evicted_object_is_a_miss(tmp_path):
+    cache = CoverCache(root=str(tmp_path))
+    path, _, _ = cache._write("ol-1", b"\xff\xd8\xffdata", "image/jpeg", ".jpg")
+    assert await cache.read(path) == b"\xff\xd8\xffdata"
+
+    tmp_path.joinpath(path).unlink()
+    assert await cache.read(path) is None
+    # The dangling ref reads as a miss, so the next get() fetches the cover again
+    assert cache._read_ref("ol-1") is None
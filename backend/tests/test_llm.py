@@ -0,0 +1,102 @@
+import asyncio
+
+import pytest
+import pytest_asyncio
+from aiohttp import web
+
+from models.pydantic_models import ChatIntent
+from services import llm
+from services.llm import FakeLLMClient, GeminiClient, LLMClient, LLMError
+from services.structured_output import StructuredOutputParser
+
+
+def test_llm_client_is_abstract():
+    with pytest.raises(TypeError):
+        LLMClient()
+
+
+@pytest.mark.asyncio
+async def test_fake_client_reply_parses_as_a_chat_intent():
+    client = FakeLLMClient(latency_ms=0)
+    response = await client.generate("what can you do?", system_instruction="x" * 400)
+    intent = StructuredOutputParser(ChatIntent).parse(response.text)
+    assert intent is not None and intent.intent == "help"
+    assert response.cached_tokens == 100
+    assert client.usage["requests"] == 1 and client.calls == 1
+
+
+@pytest.mark.asyncio
+async def test_fake_client_uses_a_custom_reply():
+    client = FakeLLMClient(reply=lambda prompt: prompt.upper(), latency_ms=0)
+    assert (await client.generate("hi")).text == "HI"
+
+
+GENERATED = {
+    "candidates": [{"content": {"parts": [{"text": '{"intent": "fines", '}, {"text": '"message": "m"}'}]}}],
+    "usageMetadata": {"promptTokenCount": 12, "candidatesTokenCount": 5, "cachedContentTokenCount": 0},
+}
+
+
+@pytest_asyncio.fixture
+async def gemini(monkeypatch):
+    """A local generateContent endpoint answering with the queued (status, payload, headers) replies"""
+    replies, bodies = [], []
+
+    async def generate(request):
+        bodies.append(await request.json())
+        status, payload, headers = replies.pop(0)
+        return web.json_response(payload, status=status, headers=headers)
+
+    app = web.Application()
+    app.router.add_post("/models/{model}:generateContent", generate)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    monkeypatch.setattr(llm, "GEMINI_API_URL", f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}")
+    client = GeminiClient("key", context_cache=False, max_retries=2)
+    yield client, replies, bodies
+    await client.close()
+    await runner.cleanup()
+
+
+@pytest.mark.asyncio
+async def test_gemini_retries_overload_and_joins_parts(gemini):
+    client, replies, bodies = gemini
+    replies.extend([(503, {"error": {"message": "overloaded"}}, {"Retry-After": "0"}), (200, GENERATED, {})])
+
+    response = await client.generate("prompt", {"temperature": 0}, system_instruction="system")
+    assert response.text == '{"intent": "fines", "message": "m"}'
+    assert response.prompt_tokens == 12 and response.output_tokens == 5
+    assert len(bodies) == 2
+    assert bodies[0]["systemInstruction"] == {"parts": [{"text": "system"}]}
+    assert bodies[0]["generationConfig"] == {"temperature": 0}
+    assert client.usage["requests"] == 1
+
+
+@pytest.mark.asyncio
+async def test_gemini_client_errors_are_not_retried(gemini):
+    client, replies, bodies = gemini
+    replies.append((400, {"error": {"message": "bad request"}}, {}))
+    with pytest.raises(LLMError, match="400: bad request"):
+        await client.generate("prompt")
+    assert len(bodies) == 1
+
+
+@pytest.mark.asyncio
+async def test_gemini_blocked_prompt_raises(gemini):
+    client, replies, _ = gemini
+    replies.append((200, {"promptFeedback": {"blockReason": "SAFETY"}}, {}))
+    with pytest.raises(LLMError, match="SAFETY"):
+        await client.generate("prompt")
+
+
+@pytest.mark.asyncio
+async def test_cancelling_the_caller_aborts_the_request(gemini):
+    client, replies, _ = gemini
+    replies.append((503, {}, {"Retry-After": "30"}))
+    task = asyncio.create_task(client.generate("prompt"))
+    await asyncio.sleep(0.2)
+    task.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await task
@@ -0,0 +1,56 @@
+import pytest
+from aiohttp import web
+
+from services import llm
+
+
+async def start_fake_gemini(responses):
+    """Serve cachedContents with the queued (status, payload) replies; returns (runner, base url, calls)"""
+    calls = []
+
+    async def cached_contents(request):
+        calls.append(await request.json())
+        status, payload = responses.pop(0)
+        return web.json_response(payload, status=status)
+
+    app = web.Application()
+    app.router.add_post("/cachedContents", cached_contents)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    return runner, f"http://127.0.0.1:{port}", calls
+
+
+@pytest.mark.asyncio
+async def test_transient_failure_keeps_caching_enabled(monkeypatch):
+    runner, url, calls = await start_fake_gemini([
+        (503, {"error": {"message": "overloaded"}}),
+        (200, {"name": "cachedContents/abc"}),
+    ])
+    monkeypatch.setattr(llm, "GEMINI_API_URL", url)
+    client = llm.GeminiClient("key", context_cache=True)
+    try:
+        assert await client._cached_content("prefix") is None
+        assert client.context_cache
+        assert await client._cached_content("prefix") == "cachedContents/abc"
+        assert len(calls) == 2
+    finally:
+        await client.close()
+        await runner.cleanup()
+
+
+@pytest.mark.asyncio
+async def test_too_small_prefix_disables_caching(monkeypatch):
+    runner, url, _ = await start_fake_gemini([
+        (400, {"error": {"message": "Cached content is too small. total_token_count=100, min_total_token_count=4096"}}),
+    ])
+    monkeypatch.setattr(llm, "GEMINI_API_URL", url)
+    client = llm.GeminiClient("key", context_cache=True)
+    try:
+        assert await client._cached_content("prefix") is None
+        assert not client.context_cache
+    finally:
+        await client.close()
+        await runner.cleanup()
@@ -0,0 +1,42 @@
+import pytest
+
+from services.query_classifier import QueryClassifier
+
+
+@pytest.fixture
+def classifier():
+    return QueryClassifier()
+
+
+@pytest.mark.parametrize("query, technical", [
+    ("Python programming", True),
+    ("learn  JavaScript", True),
+    ("java", True),
+    ("databases for beginners", True),
+    ("machine   learning", True),
+    ("Pride and Prejudice", False),
+    ("said the captain", False),  # "ai" only matches as a whole word
+    ("nodejs", False),
+    ("", False),
+])
+def test_is_technical(classifier, query, technical):
+    assert classifier.is_technical(query) is technical
+
+
+def test_classify_many_matches_is_technical(classifier):
+    queries = ["python", "romance novels", "Python", "SQL tuning", "the java coffee", "gardening", "react hooks"]
+    assert classifier.classify_many(queries) == [classifier.is_technical(q) for q in queries]
+    assert classifier.classify_many([]) == []
+
+
+def test_keywords_can_be_extended():
+    classifier = QueryClassifier(["rust", "Distributed  Systems"])
+    assert classifier.is_technical("distributed systems in practice")
+    assert classifier.is_technical("Rust")
+    assert not classifier.is_technical("python")
+
+
+def test_results_are_cached(classifier):
+    classifier.is_technical("python")
+    classifier.is_technical("  PYTHON ")
+    assert classifier.cache_info().hits == 1
@@ -0,0 +1,26 @@
+import pytest
+
+from main import is_generic_recommendation_request
+
+
+@pytest.mark.parametrize("message", [
+    "Recommend me something",
+    "can you suggest a good book?",
+    "What should I read next",
+])
+def test_generic_requests_are_short_circuited(message):
+    assert is_generic_recommendation_request(message)
+
+
+@pytest.mark.parametrize("message", [
+    "recommend me history books",
+    "recommend me python books",
+    "suggest some horror novels",
+    "what should i read about machine learning",
+])
+def test_topic_requests_go_to_the_llm(message):
+    assert not is_generic_recommendation_request(message)
+
+
+def test_non_recommendation_messages():
+    assert not is_generic_recommendation_request("show my issued books")
@@ -0,0 +1,38 @@
+from models.pydantic_models import ChatIntent
+from services.structured_output import StructuredOutputParser, extract_json_object
+
+
+def test_null_fields_fall_back_to_defaults():
+    parser = StructuredOutputParser(ChatIntent)
+    reply = parser.parse('{"message": "m", "intent": null, "type": null, "suggestions": null, '
+                         '"search_query": null, "show_issued": null, "show_fines": null}')
+    assert reply is not None
+    assert reply.intent == reply.type == "help"
+    assert reply.suggestions == []
+    assert reply.search_query == ""
+    assert reply.show_issued is False and reply.show_fines is False
+    assert parser.stats["json"] == 1
+
+
+def test_fenced_reply_is_extracted():
+    parser = StructuredOutputParser(ChatIntent)
+    reply = parser.parse('Sure!\n```json\n{"intent": "fines", "message": "You owe nothing"}\n```')
+    assert reply is not None
+    assert reply.intent == reply.type == "fines"
+    assert parser.stats["extracted"] == 1
+
+
+def test_unknown_intent_degrades_to_help():
+    reply = StructuredOutputParser(ChatIntent).parse('{"intent": "weather", "message": "m"}')
+    assert reply.intent == "help"
+
+
+def test_reply_without_json_is_counted():
+    parser = StructuredOutputParser(ChatIntent)
+    assert parser.parse("I can't help with that") is None
+    assert parser.stats["no_json"] == 1
+    assert parser.failure_rate() == 1.0
+
+
+def test_extract_skips_braces_that_are_not_json():
+    assert extract_json_object('use {braces} then {"a": 1}') == {"a": 1}
@@ -0,0 +1,95 @@
+import asyncio
+import time
+
+import pytest
+
+from services import telegram
+from services.telegram import TelegramError, TelegramSender, format_reply, parse_update
+
+
+class FakeBotAPI:
+    """Records sends; failures maps a call number to the TelegramError it raises"""
+
+    def __init__(self, failures=None):
+        self.failures = failures or {}
+        self.sent = []
+
+    async def send_message(self, chat_id, text):
+        call = len(self.sent)
+        self.sent.append((time.monotonic(), chat_id, text))
+        if call in self.failures:
+            raise self.failures[call]
+        return {}
+
+    async def close(self):
+        pass
+
+
+async def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+@pytest.mark.asyncio
+async def test_429_pauses_only_that_chat_and_keeps_order():
+    api = FakeBotAPI({0: TelegramError(429, "Too Many Requests", retry_after=0.3)})
+    sender = TelegramSender(api, global_per_second=100, chat_per_minute=600)
+    sender.start()
+    sender.submit("a", "first")
+    sender.submit("a", "second")
+    sender.submit("b", "other chat")
+    await wait_for(lambda: sender.stats["sent"] == 3)
+    await sender.stop()
+
+    times = {(chat, text): at for at, chat, text in api.sent}
+    retried_at = [at for at, chat, text in api.sent if text == "first"]
+    assert len(retried_at) == 2 and retried_at[1] - retried_at[0] >= 0.3
+    # The paused chat's queue stays in order; the other chat isn't held up
+    assert times[("a", "first")] < times[("a", "second")]
+    assert times[("b", "other chat")] < retried_at[1]
+    assert sender.stats["rate_limited"] == 1
+
+
+@pytest.mark.asyncio
+async def test_server_errors_back_off_exponentially(monkeypatch):
+    monkeypatch.setattr(telegram, "TELEGRAM_RETRY_BASE_SECONDS", 0.1)
+    api = FakeBotAPI({0: TelegramError(502, "Bad Gateway"), 1: TelegramError(502, "Bad Gateway")})
+    sender = TelegramSender(api, global_per_second=100, chat_per_minute=600)
+    sender.start()
+    sender.submit("a", "hello")
+    await wait_for(lambda: sender.stats["sent"] == 1)
+    await sender.stop()
+
+    attempts = [at for at, _, _ in api.sent]
+    assert attempts[1] - attempts[0] >= 0.1
+    assert attempts[2] - attempts[1] >= 0.2
+
+
+@pytest.mark.asyncio
+async def test_client_errors_are_dropped():
+    api = FakeBotAPI({0: TelegramError(403, "bot was blocked by the user")})
+    sender = TelegramSender(api, global_per_second=100, chat_per_minute=600)
+    sender.start()
+    sender.submit("a", "hello")
+    await wait_for(lambda: sender.stats["failed"] == 1)
+    await sender.stop()
+    assert len(api.sent) == 1
+
+
+def test_parse_update():
+    assert parse_update({"message": {"chat": {"id": 42}, "text": " hi "}}) == ("42", "hi")
+    assert parse_update({"edited_message": {}}) is None
+
+
+class Book:
+    def __init__(self, title, author):
+        self.title, self.author = title, author
+
+
+def test_format_reply_lists_books_and_ignores_dict_data():
+    reply = format_reply({"message": "Found these", "data": [Book(f"T{i}", "A") for i in range(7)]})
+    assert reply.splitlines()[1] == "• T0 by A"
+    assert reply.endswith("…and 2 more in the app")
+    assert format_reply({"message": "Open 9-5", "data": {"hours": "9-5"}}) == "Open 9-5"
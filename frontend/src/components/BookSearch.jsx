@@ -1,6 +1,6 @@
 "use client"
 
-import { useState } from "react"
+import { useEffect, useState } from "react"
 import { Search, Filter, Book } from "lucide-react"
 // import "../styles/components/BookSearch.css"
 
@@ -8,12 +8,31 @@ const BookSearch = ({ apiCall }) => {
   const [searchQuery, setSearchQuery] = useState("")
   const [searchResults, setSearchResults] = useState([])
   const [loading, setLoading] = useState(false)
+  const [suggestions, setSuggestions] = useState([])
   const [filters, setFilters] = useState({
     genre: "",
     author: "",
     availability: "all",
   })
 
+  // Typeahead: the suggest endpoint answers from memory, so a short debounce is enough
+  useEffect(() => {
+    const query = searchQuery.trim()
+    if (!query) {
+      setSuggestions([])
+      return
+    }
+    const timer = setTimeout(async () => {
+      try {
+        const response = await apiCall(`/api/books/suggest?q=${encodeURIComponent(query)}&limit=8`)
+        setSuggestions(response.suggestions || [])
+      } catch (error) {
+        setSuggestions([])
+      }
+    }, 100)
+    return () => clearTimeout(timer)
+  }, [searchQuery, apiCall])
+
   const handleSearch = async (query = searchQuery) => {
     if (!query.trim()) return
 
@@ -72,7 +91,16 @@ const BookSearch = ({ apiCall }) => {
             onKeyPress={(e) => e.key === "Enter" && handleSearch()}
             placeholder="Search for books, authors, topics..."
             className="search-input"
+            list="book-suggestions"
+            autoComplete="off"
           />
+          <datalist id="book-suggestions">
+            {suggestions.map((suggestion) => (
+              <option key={`${suggestion.kind}:${suggestion.text}`} value={suggestion.text}>
+                {suggestion.kind}
+              </option>
+            ))}
+          </datalist>
           <button onClick={() => handleSearch()} className="btn btn-primary" disabled={loading}>
             {loading ? "Searching..." : "Search"}
           </button>